@@ -82,9 +82,11 @@ class ExitHandler(object):
             self._log.debug('Exit in progress, exit request ignored')
             return
         self._log.info('Exit request received')
-        self._exit_task = self._loop.create_task(self._loop_exit())
+        # Mark exit as sent before creating the task - with eager task
+        # factory the task body starts running right away.
         self._exit_sent = True
         self._exit_code = exit_code
+        self._exit_task = self._loop.create_task(self._loop_exit())
 
     async def wait(self):
         """If exit task is active, wait for it to finish."""
@@ -97,14 +99,54 @@ class ExitHandler(object):
         # Cleanup current connections.
         # It's done before disabling the server, so that
         # asyncio is less unhappy.
-        for connection in self._conn_manager.get_connections():
-            await connection.close()
+        closed = set(self._conn_manager.get_connections())
+        await self._gather_logged(connection.close() for connection in closed)
         # Shutdown the server(s) so we don't accept new ones.
-        for server in reversed(self._servers):
-            await server.shutdown()
-        # Cleanup any leftovers.
-        for connection in self._conn_manager.get_connections():
-            await connection.close()
+        await self._gather_logged(
+            server.shutdown() for server in reversed(self._servers)
+        )
+        # Cleanup any leftovers - connections accepted while
+        # the servers were shutting down.
+        await self._gather_logged(
+            connection.close()
+            for connection in self._conn_manager.get_connections()
+            if connection not in closed
+        )
+
+    async def _gather_logged(self, coroutines):
+        """Run coroutines concurrently, log (but do not raise) errors."""
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self._log.error(
+                    'Error during exit cleanup: %s', result, exc_info=result
+                )
+
+
+def setup_event_loop_policy(event_loop, logger):
+    """Install event loop policy requested by the config.
+
+    Alternative loops are optional dependencies, so if the requested
+    one cannot be imported the default asyncio loop is used.
+    """
+    if event_loop == 'asyncio':
+        return
+    try:
+        if event_loop == 'uvloop':
+            import uvloop
+            policy = uvloop.EventLoopPolicy()
+        elif event_loop == 'uringcore':
+            import uringcore
+            policy = uringcore.EventLoopPolicy()
+        else:
+            raise ValueError('unknown event loop \'%s\'' % (event_loop,))
+    except ImportError:
+        logger.warning(
+            'Event loop \'%s\' is not available, using asyncio', event_loop
+        )
+        return
+    asyncio.set_event_loop_policy(policy)
+    logger.info('Using \'%s\' event loop', event_loop)
 
 
 def make_signal_handler(exit_handler, loop):
@@ -122,6 +164,20 @@ def make_signal_handler(exit_handler, loop):
     return on_exit
 
 
+def setup_signal_handlers(exit_handler, loop):
+    """Call exit handler on SIGINT/SIGTERM.
+
+    Loop signal handlers are dispatched directly by the loop, so no
+    threadsafe wakeup is needed. They are not available on Windows,
+    plain 'signal' module handler is used as a fallback there.
+    """
+    try:
+        loop.add_signal_handler(signal.SIGINT, exit_handler)
+        loop.add_signal_handler(signal.SIGTERM, exit_handler)
+    except NotImplementedError:
+        signal.signal(signal.SIGINT, make_signal_handler(exit_handler, loop))
+
+
 async def run(args, config, main_log, loop):
     servers = []
     lifetime_tasks = []
@@ -149,7 +205,8 @@ async def run(args, config, main_log, loop):
     )
     control_app = prouter.control_app.get_application(
         conn_manager, identity, exit_handler,
-        logging.getLogger(LOGGER_NAME_CONTROL_APP)
+        logging.getLogger(LOGGER_NAME_CONTROL_APP),
+        max_upload_size=config['control'].get('max_upload_size')
     )
 
     if config['server']['enabled']:
@@ -176,8 +233,12 @@ async def run(args, config, main_log, loop):
     servers.append(control_server)
     lifetime_tasks.append(control_server.wait())
 
-    signal.signal(signal.SIGINT, make_signal_handler(exit_handler, loop))
-    await asyncio.wait(lifetime_tasks, loop=loop)
+    setup_signal_handlers(exit_handler, loop)
+    # Wait for all servers, one failing server should not stop the others.
+    results = await asyncio.gather(*lifetime_tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            main_log.error('Server failed: %s', result, exc_info=result)
 
 
 def main():
@@ -188,7 +249,20 @@ def main():
     main_log = logging.getLogger(LOGGER_NAME_ROOT)
     main_log.info('Staring pRouter')
 
+    setup_event_loop_policy(
+        config['server'].get('event_loop', 'asyncio'), main_log
+    )
     loop = asyncio.get_event_loop()
+    # Python 3.12+: run task bodies synchronously until the first real
+    # suspension, short requests then complete without a loop iteration.
+    if config['server'].get('eager_tasks', False):
+        if hasattr(asyncio, 'eager_task_factory'):
+            loop.set_task_factory(asyncio.eager_task_factory)
+            main_log.info('Eager task factory enabled')
+        else:
+            main_log.warning(
+                'Eager task factory is not available, option ignored'
+            )
     try:
         loop.run_until_complete(run(args, config, main_log, loop))
     finally:
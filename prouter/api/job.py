@@ -21,15 +21,19 @@
 # SOFTWARE.
 #
 
+import asyncio
 import io
+import os
 import pathlib
-import shutil
 import stat
 import tarfile
 import tempfile
 import uuid
 
-from prouter import control_app
+from prouter import archive_stream, control_app
+
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16
 
 
 class Job(object):
@@ -43,6 +47,10 @@ class Job(object):
         token: agent access token.
         runtimes: list of agent runtimes for automatic agent selection.
     """
+    __slots__ = ('_router', '_job', '_base_path', '_args')
+
+    _UPLOAD_HEADERS = {'Content-Type': 'application/octet-stream'}
+
     def __init__(self, router, name,
                  uid=None, address=None, token=None, runtimes=None):
         assert address is None == token is None, (
@@ -52,6 +60,7 @@ class Job(object):
 
         self._router = router
         self._job = None
+        self._base_path = None
         agent = {}
         if uid:
             agent['type'] = 'uid'
@@ -98,17 +107,14 @@ class Job(object):
             target: destination path must be relative.
             source: upload target, string interpreted as file or directory path
                 bytes-like objects are uploaded as file content
-            tmpdir: temporary directory where upload archive is created.
+            tmpdir: if set, directory archive is built in a temporary
+                file there and sent with Content-Length, as routers
+                without streamed upload support require; otherwise
+                the archive is streamed (chunked, no temporary file).
             params: additional request parameters (i.e. executable=1).
         """
         target = pathlib.Path(target)
-        kwargs = {
-            'headers': {
-                'Content-Type': 'application/octet-stream',
-                'Content-Length': None
-            },
-            'data': None
-        }
+        kwargs = {}
         if params:
             kwargs['params'] = {k: str(v) for k, v in params.items()}
 
@@ -117,63 +123,66 @@ class Job(object):
             if not isinstance(source, io.BytesIO):
                 source = io.BytesIO(source)
             source.seek(0, io.SEEK_END)
-            kwargs['headers']['Content-Length'] = str(source.tell())
+            kwargs['headers'] = self._upload_headers(source.tell())
             source.seek(0, io.SEEK_SET)
             kwargs['data'] = source
-            return await self._request('POST', 'file/%s' % (target,),
+            return await self._request('POST', f'file/{target}',
                                        result=False, kwargs=kwargs)
 
         source = pathlib.Path(source)
         if not source.exists():
-            raise ValueError('upload source not found: \'%s\'' % (source,))
+            raise ValueError(f'upload source not found: \'{source}\'')
 
         if source.is_file():
-            file_stat = source.stat()
-            if file_stat.st_mode & stat.S_IEXEC:
-                if 'params' not in kwargs:
-                    kwargs['params'] = {}
-                kwargs['params']['executable'] = '1'
             with source.open('rb') as file:
+                # Stat the open descriptor, no second path lookup.
+                file_stat = os.fstat(file.fileno())
+                if file_stat.st_mode & stat.S_IEXEC:
+                    if 'params' not in kwargs:
+                        kwargs['params'] = {}
+                    kwargs['params']['executable'] = '1'
                 kwargs['data'] = file
-                kwargs['headers']['Content-Length'] = str(file_stat.st_size)
-                return await self._request('POST', 'file/%s' % (target,),
+                kwargs['headers'] = self._upload_headers(file_stat.st_size)
+                return await self._request('POST', f'file/{target}',
                                            result=False, kwargs=kwargs)
 
-        create_tmp = not tmpdir
-        tmpdir = pathlib.Path(tempfile.mkdtemp() if create_tmp else tmpdir)
-        arcpath = None
-        try:
-            arcpath = tmpdir.joinpath('%s.tar' % (uuid.uuid4().hex,))
-            with tarfile.open(arcpath, 'w') as arc:
-                for item in source.iterdir():
-                    arc.add(item, arcname=target.joinpath(item.name))
-            kwargs['headers']['Content-Length'] = str(arcpath.stat().st_size)
-            with open(arcpath, 'rb') as arc:
+        if tmpdir is not None:
+            with tempfile.TemporaryFile(dir=tmpdir) as arc:
+                await asyncio.get_event_loop().run_in_executor(
+                    None, archive_stream.pack_directory_file,
+                    source, target, arc
+                )
+                kwargs['headers'] = self._upload_headers(arc.tell())
+                arc.seek(0, io.SEEK_SET)
                 kwargs['data'] = arc
                 return await self._request(
                     'POST', 'archive', result=False, kwargs=kwargs
                 )
-        finally:
-            if create_tmp:
-                shutil.rmtree(tmpdir)
-            else:
-                arcpath.unlink()
+
+        # Archive is streamed while being built, so no temporary file
+        # is used and the size is not known in advance.
+        kwargs['headers'] = self._upload_headers()
+        kwargs['data'] = archive_stream.pack_directory(source, target)
+        return await self._request(
+            'POST', 'archive', result=False, kwargs=kwargs
+        )
 
     async def download(self, target):
         """ Download specified file from job directory.
         Args:
             target: path to download target, must be relative.
-        Returns: downloaded data as bytearray.
+        Returns: downloaded data as bytes.
         """
-        url = self._router.url.with_path(self._path('file/%s' % target))
+        url = self._router.url.with_path(self._path(f'file/{target}'))
         async with self._router.session.request('GET', url) as response:
             response.raise_for_status()
-            buffer = io.BytesIO()
-            chunk = await response.content.readany()
-            while chunk:
-                buffer.write(chunk)
-                chunk = await response.content.readany()
-            return buffer.getvalue()
+            # Size is known - read exactly that much (detects truncated
+            # responses), otherwise read until EOF.
+            if response.content_length is not None:
+                return await response.content.readexactly(
+                    response.content_length
+                )
+            return await response.read()
 
     async def download_archive(
             self, target, exclude=None, tmpdir=None, destination=None):
@@ -195,7 +204,7 @@ class Job(object):
             destination.mkdir(parents=True, exist_ok=True)
 
         arcpath = pathlib.Path(tmpdir) if destination is None else destination
-        arcpath = arcpath.joinpath('%s.tar' % (uuid.uuid4().hex,))
+        arcpath = arcpath.joinpath(f'{uuid.uuid4().hex}.tar')
         try:
             with open(arcpath, 'wb') as arc:
                 url = self._router.url.with_path(self._path('archive'))
@@ -207,14 +216,12 @@ class Job(object):
                 )
                 async with response:
                     response.raise_for_status()
-                    chunk = await response.content.readany()
-                    while chunk:
+                    async for chunk in response.content.iter_chunked(
+                            DOWNLOAD_CHUNK_SIZE):
                         arc.write(chunk)
-                        chunk = await response.content.readany()
             if destination is None:
                 return arcpath
-            with tarfile.open(arcpath, 'r') as arc:
-                arc.extractall(destination)
+            await _extract_archive(arcpath, destination)
             arcpath.unlink()
         except Exception:
             if arcpath.exists():
@@ -223,21 +230,27 @@ class Job(object):
 
     async def http(self, method, path, **kwargs):
         """ Send http request to job. """
-        url = self._router.url.with_path(self._path('http/%s' % path))
+        url = self._router.url.with_path(self._path(f'http/{path}'))
         return await self._router.session.request(method, url, **kwargs)
 
     async def ws(self, path, **kwargs):
         """ Open websocket connection with job. """
-        url = self._router.url.with_path(self._path('http/%s' % path))
+        url = self._router.url.with_path(self._path(f'http/{path}'))
         return await self._router.session.ws_connect(url, **kwargs)
 
     async def ws_loopback(self, path, loopback_url):
         kwargs = {'json': {'url': str(loopback_url)}}
-        await self._request('POST', 'wsconnect/%s' % path, False, kwargs)
+        await self._request('POST', f'wsconnect/{path}', False, kwargs)
+
+    def _upload_headers(self, size=None):
+        headers = dict(self._UPLOAD_HEADERS)
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return headers
 
     def _path(self, path):
-        assert self._job
-        return '%s/%s' % (self._job['path'], path)
+        assert self._base_path
+        return f'{self._base_path}/{path}'
 
     async def _request(self, method, path, result=True, kwargs=None):
         return await self._router.request(
@@ -248,8 +261,26 @@ class Job(object):
         self._job = await self._router.request(
             'POST', control_app.ROUTE_JOB_CREATE, kwargs=self._args
         )
+        self._base_path = self._job['path']
         return self
 
     async def __aexit__(self, *exc_info):
         await self._request('POST', 'remove')
         self._job = None
+        self._base_path = None
+
+
+async def _extract_archive(arcpath, destination):
+    """Unpack tar archive to the destination directory.
+
+    Extraction runs in the default executor and follows the
+    `archive_stream.safe_extractall` policy.
+    """
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, _extract_archive_sync, arcpath,
+                               destination)
+
+
+def _extract_archive_sync(arcpath, destination):
+    with tarfile.open(arcpath, 'r') as arc:
+        archive_stream.safe_extractall(arc, destination)
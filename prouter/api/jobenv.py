@@ -24,7 +24,7 @@
 import pathlib
 import re
 from collections import namedtuple
-from random import randint
+from random import choice
 
 import yaml
 
@@ -39,46 +39,38 @@ def search(path_or_evironment):
     result = []
     if isinstance(path_or_evironment, dict):
         for var, value in path_or_evironment.items():
-            match = _ENV_VARIABLE_REGEX.match(var)
-            if match:
-                result.append(JobEnv(match[1], _version(match[2]), value))
+            # Most variables are unrelated, skip them without regex.
+            if not var.startswith(_ENV_VARIABLE_PREFIX):
+                continue
+            guid, _, version = var[len(_ENV_VARIABLE_PREFIX):].rpartition('__')
+            if guid and _ENV_VARIABLE_VERSION_REGEX.match(version):
+                result.append(JobEnv(guid, _version(version), value))
         return result
 
     for path in pathlib.Path(path_or_evironment).glob('*/%s' % (_MANIFEST,)):
-        with open(path, mode='r', encoding='utf-8') as file:
-            manifest = yaml.load(file, Loader=yaml.CSafeLoader)
-            if manifest.get(_MANIFEST_TYPE_KEY, None) != _MANIFEST_TYPE:
-                continue
-            if manifest.get(_MANIFEST_VERSION_KEY, None) != _MANIFEST_VERSION:
-                continue
-            if not all([key in manifest
-                        for key in ['activate', 'guid', 'version']]):
-                continue
-            activate = path.parent.absolute().joinpath(manifest['activate'])
-            if not activate.is_file():
-                continue
-            result.append(JobEnv(
-                manifest['guid'], _version(manifest['version']), activate))
+        jobenv = _load_manifest(path)
+        if jobenv is not None:
+            result.append(jobenv)
     return result
 
 def select(hosts, runtimes):
     """ Search for a suitable host for a job with required runtimes.
         Returns: host, its jobenv and runtime uid """
     if not runtimes:
-        return hosts[randint(0, len(hosts) - 1)], None, None
+        return choice(hosts), None, None
 
     selected = {}
     for host in hosts:
+        host_jobenvs = _jobenvs_by_guid(host.jobenvs)
         for rt in runtimes:
-            matched, jobenv = _runtime_match(rt, host)
+            matched, jobenv = _runtime_match(rt, host, host_jobenvs)
             if matched:
                 selected[host.uid] = (host, jobenv, rt.uid)
                 break
     if not selected:
         raise ValueError('failed to select host for required runtimes')
 
-    ids = list(selected.keys())
-    return selected[ids[randint(0, len(ids) - 1)]]
+    return choice(list(selected.values()))
 
 def jobenv_from_dict(data):
     """ Returns: JobEnv object created from dictionary. """
@@ -86,7 +78,8 @@ def jobenv_from_dict(data):
         data['guid'], _version(data['version']), data.get('activate', None))
 
 
-_ENV_VARIABLE_REGEX = re.compile(r'^JOBENV__(.+?)__(\d+?\.\d+?.+?)$')
+_ENV_VARIABLE_PREFIX = 'JOBENV__'
+_ENV_VARIABLE_VERSION_REGEX = re.compile(r'\d+\.\d+.')
 _MANIFEST = 'manifest.yaml'
 _MANIFEST_TYPE_KEY = 'manifest_type'
 _MANIFEST_TYPE = 'jobenv'
@@ -94,6 +87,20 @@ _MANIFEST_VERSION_KEY = 'manifest_version'
 _MANIFEST_VERSION = '1.0.0'
 
 
+def _load_manifest(path):
+    with open(path, mode='r', encoding='utf-8') as file:
+        manifest = yaml.load(file, Loader=yaml.CSafeLoader)
+    if manifest.get(_MANIFEST_TYPE_KEY, None) != _MANIFEST_TYPE:
+        return None
+    if manifest.get(_MANIFEST_VERSION_KEY, None) != _MANIFEST_VERSION:
+        return None
+    if not all([key in manifest for key in ['activate', 'guid', 'version']]):
+        return None
+    activate = path.parent.absolute().joinpath(manifest['activate'])
+    if not activate.is_file():
+        return None
+    return JobEnv(manifest['guid'], _version(manifest['version']), activate)
+
 def _version(version):
     return tuple(map(int, version.split('.'))
                  if isinstance(version, str) else version)
@@ -103,7 +110,13 @@ def _jobenv_match(host, required):
             host.version[0] == required.version[0] and
             host.version >= required.version)
 
-def _runtime_match(runtime, host):
+def _jobenvs_by_guid(jobenvs):
+    index = {}
+    for jobenv in jobenvs:
+        index.setdefault(jobenv.guid, []).append(jobenv)
+    return index
+
+def _runtime_match(runtime, host, host_jobenvs):
     if runtime.platforms:
         for platform in runtime.platforms:
             for param, value in platform.items():
@@ -118,9 +131,8 @@ def _runtime_match(runtime, host):
     if not runtime.jobenvs:
         return True, None
 
-    # @TODO: nested cycles are bad
     for required_env in runtime.jobenvs:
-        for host_env in host.jobenvs:
+        for host_env in host_jobenvs.get(required_env.guid, ()):
             if _jobenv_match(host_env, required_env):
                 return True, host_env
     return False, None
@@ -28,19 +28,59 @@ from prouter import control_app
 
 from .job import Job
 
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        # aiohttp expects str from the serializer.
+        return orjson.dumps(obj).decode('utf-8')
+
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
+
+def _create_session(connector, loop=None):
+    return aiohttp.ClientSession(
+        connector=connector, json_serialize=_json_dumps, loop=loop
+    )
+
+
+UNIX_SOCKET_SCHEME = 'unix://'
+
 
 class Router(object):
     """ Remote access to router.
     Args:
-        address: router address.
-        session: aiohttp client session.
+        address: router address, 'unix://<socket path>' addresses
+            connect through a unix socket (e.g. a local reverse proxy
+            in front of the router control API).
+        session: aiohttp client session, by default the router creates
+            its own keep-alive session and closes it in `close`.
         loop: asyncio eventloop.
     """
     def __init__(self, address, session=None, loop=None):
+        self._own_session = session is None
+        if address.startswith(UNIX_SOCKET_SCHEME):
+            # Host is irrelevant, requests go to the socket.
+            self._url = yarl.URL('http://localhost')
+            self._session = session or _create_session(
+                aiohttp.UnixConnector(
+                    address[len(UNIX_SOCKET_SCHEME):], loop=loop
+                ),
+                loop
+            )
+            return
         self._url = yarl.URL(address)
         if not self._url.is_absolute():
             self._url = yarl.URL('http://%s' % (address))
-        self._session = session or aiohttp.ClientSession(loop=loop)
+        self._session = session or _create_session(
+            aiohttp.TCPConnector(limit=0, keepalive_timeout=75, loop=loop),
+            loop
+        )
 
     @property
     def url(self):
@@ -52,6 +92,11 @@ class Router(object):
         """ Returns: client session. """
         return self._session
 
+    async def close(self):
+        """ Close the client session, unless it was passed by the caller. """
+        if self._own_session:
+            await self._session.close()
+
     async def connections(self):
         """ Returns: information about router connections as json. """
         return await self.request('GET', control_app.ROUTE_CONNECTIONS)
@@ -64,7 +109,7 @@ class Router(object):
         async with response:
             response.raise_for_status()
             if result:
-                return await response.json()
+                return await response.json(loads=_json_loads)
 
     def job(self, name, uid=None, address=None, token=None, runtimes=None):
         """ Create job on specified agent.
@@ -76,3 +121,9 @@ class Router(object):
         Returns: new job instance.
         """
         return Job(self, name, uid, address, token, runtimes)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
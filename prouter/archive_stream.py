@@ -0,0 +1,241 @@
+#
+# coding: utf-8
+# Copyright (c) 2018 DATADVANCE
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import os
+import pathlib
+import tarfile
+
+
+CHUNK_SIZE = 1 << 16
+# Tar stream block size used when packing, each block is one queue item.
+PACK_BUFFER_SIZE = 1 << 20
+QUEUE_DEPTH = 8
+
+
+class ArchiveStreamAborted(Exception):
+    """Archive consumer stopped reading the stream."""
+
+
+class _QueueWriter(object):
+    """File-like object passing written data to an asyncio queue.
+
+    Used from a worker thread, blocks while the queue is full.
+    """
+    def __init__(self, queue, loop):
+        self._queue = queue
+        self._loop = loop
+        self._aborted = False
+
+    def abort(self):
+        """Make subsequent writes fail, stopping the worker."""
+        self._aborted = True
+
+    def write(self, data):
+        if self._aborted:
+            raise ArchiveStreamAborted('archive stream consumer is gone')
+        self.put(bytes(data))
+        return len(data)
+
+    def put(self, item):
+        asyncio.run_coroutine_threadsafe(
+            self._queue.put(item), self._loop
+        ).result()
+
+
+def pack_directory_file(source, target, fileobj):
+    """Write tar archive of the directory content to a file object.
+
+    Blocking, used to spool the archive when its size must be known
+    before sending.
+
+    Args:
+        source: Directory to pack (pathlib.Path).
+        target: Archive path prefix for the directory items.
+        fileobj: Writable binary file object.
+    """
+    with tarfile.open(fileobj=fileobj, mode='w') as arc:
+        _add_directory(arc, source, target)
+
+
+def _add_directory(arc, source, target):
+    with os.scandir(source) as entries:
+        for entry in entries:
+            arc.add(entry.path, arcname=target.joinpath(entry.name))
+
+
+async def pack_directory(source, target, loop=None):
+    """Async generator yielding tar archive of the directory content.
+
+    Archive is built in the default executor while the previous chunks
+    are consumed, so no temporary file is needed and the size is not
+    known in advance.
+
+    Args:
+        source: Directory to pack (pathlib.Path).
+        target: Archive path prefix for the directory items.
+        loop: asyncio event loop.
+    """
+    loop = loop or asyncio.get_event_loop()
+    queue = asyncio.Queue(QUEUE_DEPTH)
+    writer = _QueueWriter(queue, loop)
+
+    def build():
+        try:
+            with tarfile.open(fileobj=writer, mode='w|',
+                              bufsize=PACK_BUFFER_SIZE) as arc:
+                _add_directory(arc, source, target)
+        finally:
+            writer.put(None)
+
+    worker = loop.run_in_executor(None, build)
+    finished = False
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                finished = True
+                break
+            yield chunk
+    finally:
+        if finished:
+            # Raises if building the archive failed.
+            await worker
+        else:
+            # Consumer stopped early - let the worker fail on the next
+            # write and drain the queue so it does not block forever.
+            writer.abort()
+            while await queue.get() is not None:
+                pass
+            # The worker may also have failed on its own, retrieve its
+            # exception anyway: the reason the consumer stopped is the
+            # one propagated.
+            try:
+                await worker
+            except Exception:
+                pass
+
+
+async def unpack(stream, path, rename=None, loop=None):
+    """Extract tar archive from an aiohttp stream while it is received.
+
+    Archive is parsed in the default executor (streaming 'r|' mode),
+    so no temporary archive file is needed.
+
+    Args:
+        stream: aiohttp StreamReader with archive content.
+        path: Destination directory.
+        rename: Optional callable mapping member name to the extracted
+            name, members mapped to None are skipped. Hard link targets
+            are renamed the same way and must not be skipped.
+        loop: asyncio event loop.
+    """
+    loop = loop or asyncio.get_event_loop()
+    reader = _StreamReader(stream, loop)
+
+    def extract():
+        with tarfile.open(fileobj=reader, mode='r|',
+                          bufsize=CHUNK_SIZE) as arc:
+            safe_extractall(arc, path, rename)
+
+    await loop.run_in_executor(None, extract)
+
+
+class _StreamReader(object):
+    """File-like object reading from an aiohttp stream.
+
+    Used from a worker thread, blocks until data is received.
+    """
+    def __init__(self, stream, loop):
+        self._stream = stream
+        self._loop = loop
+
+    def read(self, size=CHUNK_SIZE):
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        return asyncio.run_coroutine_threadsafe(
+            self._stream.read(size), self._loop
+        ).result()
+
+
+def safe_extractall(arc, path, rename=None):
+    """Extract tar archive refusing members that point outside of path.
+
+    Members are checked while being extracted, in a single pass, so
+    streamed archives are supported. See `unpack` for `rename`.
+
+    Symbolic links are extracted as is, absolute ones included (job
+    trees, e.g. virtual environments, contain them), but no member is
+    written to a location outside of path, through a link or otherwise.
+    Hard links must refer to a location inside path. Where tarfile
+    supports extraction filters the 'tar' filter is applied as well:
+    setuid/setgid bits and group/other write permissions are cleared.
+    """
+    members = arc if rename is None else _renamed_members(arc, rename)
+    members = _safe_members(members, path)
+    if hasattr(tarfile, 'tar_filter'):
+        # Python 3.12+ (and security backports).
+        arc.extractall(path, members=members, filter='tar')
+    else:
+        arc.extractall(path, members=members)
+
+
+def _renamed_members(members, rename):
+    for member in members:
+        name = rename(member.name)
+        if name is None:
+            continue
+        if member.islnk():
+            # Hard links refer to other members by their archive names.
+            linkname = rename(member.linkname)
+            if linkname is None:
+                raise ValueError(
+                    'archive hard link target is not extracted: %s' %
+                    (member.linkname,)
+                )
+            member.linkname = linkname
+        member.name = name
+        yield member
+
+
+def _safe_members(members, path):
+    directory = pathlib.Path(path).resolve()
+    prefix = os.path.join(str(directory), '')
+
+    def is_outside(name):
+        # Resolved when the member is extracted, so links extracted
+        # before are taken into account.
+        target = directory.joinpath(name).resolve()
+        return target != directory and not str(target).startswith(prefix)
+
+    for member in members:
+        if is_outside(member.name):
+            raise ValueError(
+                'archive member is outside destination: %s' % (member.name,)
+            )
+        if member.islnk() and is_outside(member.linkname):
+            raise ValueError(
+                'archive hard link target is outside destination: %s' %
+                (member.linkname,)
+            )
+        yield member
@@ -23,13 +23,21 @@
 
 """Router job client."""
 
+import asyncio
 import io
+import os
 import pathlib
-import shutil
 import stat
-import tarfile
 import tempfile
 
+from .. import archive_stream
+
+
+# File upload read size, reads are done in the default executor.
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Download write size.
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
 
 class JobClient(object):
     """Router job client.
@@ -67,6 +75,8 @@ class JobClient(object):
         self = JobClient(router, cls.__init_guard)
         self._info = await self._router.request('POST', '/jobs/create',
                                                 kwds=arguments)
+        self._path_prefix = self._info['path']
+        self._info_fresh = True
         return self
 
     @classmethod
@@ -85,13 +95,18 @@ class JobClient(object):
         # Create and initialize job client instance.
         self = JobClient(router, cls.__init_guard)
         self._info = await self._router.request('GET', f'{job_path}/info')
+        self._path_prefix = self._info['path']
+        self._info_fresh = True
         return self
 
     # --------------------------------------------------------- CONTEXT MANAGER
 
     async def __aenter__(self):
-        # Just in case update the job info.
-        await self.update_info()
+        # Just in case update the job info, unless it is just fetched
+        # by the factory method.
+        if not self._info_fresh:
+            await self.update_info()
+        self._info_fresh = False
         return self
 
     async def __aexit__(self, *exc_info):
@@ -147,7 +162,7 @@ class JobClient(object):
         self._info = await self._request('POST', 'start', kwds=start_kwds)
         return self._info
 
-    async def upload(self, target, source, **params):
+    async def upload(self, target, source, spool=False, **params):
         """Upload file or directory to the job directory.
 
         Args:
@@ -155,6 +170,10 @@ class JobClient(object):
             source: Upload source, either string or bytes-like object.
                 String interpreted as a file or a directory path.
                 Bytes-like objects are uploaded as file content.
+            spool: Build directory archive in a temporary file and send
+                it with Content-Length. Required by routers without
+                streamed upload support, otherwise the archive is
+                streamed with chunked encoding.
             params: Additional request parameters (e.g. executable=1).
         """
 
@@ -170,9 +189,13 @@ class JobClient(object):
             kwds['params'] = {k: str(v) for k, v in params.items()}
 
         # Is source is a bytes-like object - upload it as a content.
-        if isinstance(source, (bytes, bytearray, io.BytesIO)):
-            if not isinstance(source, io.BytesIO):
-                source = io.BytesIO(source)
+        # Plain bytes are passed as is, aiohttp sends them without copying.
+        if isinstance(source, (bytes, bytearray)):
+            kwds['headers']['Content-Length'] = str(len(source))
+            kwds['data'] = source
+            return await self._request('POST', f'file/{str(target)}',
+                                       result=False, kwds=kwds)
+        if isinstance(source, io.BytesIO):
             source.seek(0, io.SEEK_END)
             kwds['headers']['Content-Length'] = str(source.tell())
             source.seek(0, io.SEEK_SET)
@@ -186,28 +209,35 @@ class JobClient(object):
             raise ValueError(f'Upload source not found: `{str(source)}`!')
 
         if source.is_file():
-            file_stat = source.stat()
-            if file_stat.st_mode & stat.S_IEXEC:
-                if 'params' not in kwds:
-                    kwds['params'] = {}
-                kwds['params']['executable'] = '1'
             with source.open('rb') as file:
-                kwds['data'] = file
+                # Stat the open file, so that mode and size match
+                # the content actually sent.
+                file_stat = os.fstat(file.fileno())
+                if file_stat.st_mode & stat.S_IEXEC:
+                    kwds.setdefault('params', {})['executable'] = '1'
+                kwds['data'] = _read_file(file)
                 kwds['headers']['Content-Length'] = str(file_stat.st_size)
                 return await self._request('POST', f'file/{target}',
                                            result=False, kwds=kwds)
 
-        with tempfile.TemporaryDirectory() as tempdir:
-            arcpath = pathlib.Path(tempdir).joinpath('archive.tar')
-            with tarfile.open(arcpath, 'w') as arc:
-                for item in source.iterdir():
-                    arc.add(item, arcname=target.joinpath(item.name))
-            kwds['headers']['Content-Length'] = str(
-                arcpath.stat().st_size)  # pylint: disable=no-member
-            with open(arcpath, 'rb') as arc:
-                kwds['data'] = arc
-                return await self._request(
-                    'POST', 'archive', result=False, kwds=kwds)
+        if spool:
+            loop = asyncio.get_event_loop()
+            with tempfile.TemporaryFile() as arc:
+                await loop.run_in_executor(
+                    None, archive_stream.pack_directory_file,
+                    source, target, arc
+                )
+                kwds['headers']['Content-Length'] = str(arc.tell())
+                arc.seek(0, io.SEEK_SET)
+                kwds['data'] = _read_file(arc)
+                return await self._request('POST', 'archive', result=False,
+                                           kwds=kwds)
+
+        # Stream the archive while it is being built: no temporary file,
+        # transmission starts immediately, size is not known in advance.
+        del kwds['headers']['Content-Length']
+        kwds['data'] = archive_stream.pack_directory(source, target)
+        return await self._request('POST', 'archive', result=False, kwds=kwds)
 
     async def download_file(self, source, destination=None):
         """Download file from job working directory. May return file
@@ -223,20 +253,24 @@ class JobClient(object):
             destination (str or None): destination path or None.
         Returns:
             Downloaded data as `bytes` if destination is omitted."""
-        url = self._router.url.with_path(self._path('file/%s' % source))
+        url = self._router.url.with_path(self._path(f'file/{source}'))
 
         async def _download(target):
             async with self._router.session.request('GET', url) as response:
                 response.raise_for_status()
-                chunk = await response.content.readany()
-                while chunk:
+                async for chunk in response.content.iter_chunked(
+                        DOWNLOAD_CHUNK_SIZE):
                     target.write(chunk)
-                    chunk = await response.content.readany()
 
         if destination is None:
-            buffer = io.BytesIO()
-            await _download(buffer)
-            return buffer.getvalue()
+            async with self._router.session.request('GET', url) as response:
+                response.raise_for_status()
+                # Size is known - read exactly that much (detects
+                # truncated responses), otherwise read until EOF.
+                if response.content_length is not None:
+                    return await response.content.readexactly(
+                        response.content_length)
+                return await response.read()
 
         destination = pathlib.Path(destination)
         if destination.is_dir():
@@ -257,41 +291,30 @@ class JobClient(object):
         if destination.is_file():
             raise ValueError('Can not download directory to a file!')
 
-        with tempfile.TemporaryDirectory() as tempdir:
-            arcpath = pathlib.Path(tempdir).joinpath('archive.tar')
-            with open(arcpath, 'wb') as arc:
-                url = self._router.url.with_path(self._path('archive'))
-                # router uses wildcards to include files in archive
-                params = {'include': str(source) + '/*'}
-                if exclude:
-                    params['exclude'] = str(exclude)
-                response = await self._router.session.request(
-                    'GET', url, params=params)
-                async with response:
-                    response.raise_for_status()
-                    chunk = await response.content.readany()
-                    while chunk:
-                        arc.write(chunk)
-                        chunk = await response.content.readany()
-
-            # router makes archive from job working directory and tar
-            # archive will contain source path, this means we can not
-            # unpack archive directly to destination directory and must
-            # move files to correct locations after unpacking
-            unpack_path = pathlib.Path(tempdir).joinpath('unpacked')
-            unpack_path.mkdir()  # pylint: disable=no-member
-            with tarfile.open(arcpath, 'r') as arc:
-                arc.extractall(unpack_path)
-            unpack_path = unpack_path.joinpath(source)
-            for src in unpack_path.glob('**/*'):  # pylint: disable=no-member
-                dst = destination.joinpath(src.relative_to(unpack_path))
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                if src.is_dir():
-                    dst.mkdir(exist_ok=True)
-                else:
-                    if dst.exists():
-                        dst.unlink()
-                    shutil.move(str(src), str(dst.parent))
+        # Router makes archive from job working directory, so archive
+        # members contain the source path. It is stripped while
+        # extracting and everything else is skipped.
+        source_path = pathlib.PurePosixPath(source)
+
+        def _rename(name):
+            try:
+                name = pathlib.PurePosixPath(name).relative_to(source_path)
+            except ValueError:
+                return None
+            return str(name) if name.parts else None
+
+        destination.mkdir(parents=True, exist_ok=True)
+        url = self._router.url.with_path(self._path('archive'))
+        # router uses wildcards to include files in archive
+        params = {'include': str(source) + '/*'}
+        if exclude:
+            params['exclude'] = str(exclude)
+        response = await self._router.session.request(
+            'GET', url, params=params)
+        async with response:
+            response.raise_for_status()
+            await archive_stream.unpack(
+                response.content, destination, _rename)
 
     async def http(self, method, path, **kwds):
         """Make HTTP request to the router job."""
@@ -322,7 +345,7 @@ class JobClient(object):
 
     def _path(self, path):
         """Shortcut to make a job URL path."""
-        return f'{self._info["path"]}/{path}'
+        return f'{self._path_prefix}/{path}'
 
     async def _request(self, method, path, result=True, kwds=None):
         """Make request to the job."""
@@ -350,6 +373,21 @@ class JobClient(object):
         self._router = router
         # Dict with router job info.
         self._info = None
+        # Job path, does not change during the job lifetime.
+        self._path_prefix = None
+        # Flag set by factory methods, info is not requested again
+        # when entering the context right after creation.
+        self._info_fresh = False
         # Flag which set in `detach` to avoid removing job when
         # control leaves the context manager.
         self._keep_on_exit = False
+
+
+async def _read_file(file):
+    """Yield file content read in the default executor by large chunks."""
+    loop = asyncio.get_event_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, file.read, UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
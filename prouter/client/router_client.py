@@ -40,13 +40,28 @@ class RouterClient(object):
         address: Router address.
         session: AIOHTTP client session.
         loop: Asyncio eventloop.
+        connector_limit: Total number of simultaneous connections, used
+            only if session is not given.
+        limit_per_host: Number of simultaneous connections to the same
+            endpoint (0 - no separate limit), used only if session is
+            not given.
     """
 
-    def __init__(self, address, session=None, loop=None):
+    def __init__(self, address, session=None, loop=None,
+                 connector_limit=256, limit_per_host=0):
         self._url = yarl.URL(address)
         if not self._url.is_absolute():
             self._url = yarl.URL('http://%s' % (address))
-        self._session = session or aiohttp.ClientSession(loop=loop)
+        if session is None:
+            connector = aiohttp.TCPConnector(
+                limit=connector_limit,
+                limit_per_host=limit_per_host,
+                keepalive_timeout=75,
+                enable_cleanup_closed=True,
+                loop=loop
+            )
+            session = aiohttp.ClientSession(connector=connector, loop=loop)
+        self._session = session
 
     @property
     def url(self):
@@ -84,17 +99,15 @@ class RouterClient(object):
                     'token: agent authorization token
         Return: JobClient instance."""
 
-        agent_locator = {}
-        if isinstance(agent, str):
-            agent_locator['type'] = 'uid'
-            agent_locator['uid'] = agent
-        elif isinstance(agent, dict):
-            agent_locator['type'] = 'address'
-            agent_locator['address'] = agent['address']
-            agent_locator['token'] = agent['token']
-        else:
-            agent_locator['type'] = 'select'
-            agent_locator['uids'] = list(agent)
+        locator = _AGENT_LOCATORS.get(type(agent))
+        if locator is None:
+            # Subclasses of str/dict or a sequence of uids.
+            locator = next(
+                (locator for agent_type, locator in _AGENT_LOCATORS.items()
+                 if isinstance(agent, agent_type)),
+                _agent_select_locator
+            )
+        agent_locator = locator(agent)
 
         return await JobClient.create(
             self,
@@ -112,3 +125,30 @@ class RouterClient(object):
         job_path = job['path'] if isinstance(job, dict) else job
 
         return await JobClient.attach(self, job_path)
+
+
+def _agent_uid_locator(agent):
+    return {'type': 'uid', 'uid': agent}
+
+
+def _agent_address_locator(agent):
+    return {
+        'type': 'address',
+        'address': agent['address'],
+        'token': agent['token']
+    }
+
+
+def _agent_select_locator(agent):
+    # Lists are passed as is, other iterables are materialized once.
+    return {
+        'type': 'select',
+        'uids': agent if isinstance(agent, list) else list(agent)
+    }
+
+
+# Agent locator builders by `create_job` agent argument type.
+_AGENT_LOCATORS = {
+    str: _agent_uid_locator,
+    dict: _agent_address_locator
+}
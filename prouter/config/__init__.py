@@ -22,6 +22,8 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import ast
+import functools
+import json
 import logging
 import uuid
 
@@ -35,22 +37,22 @@ from . import schemas
 def initialize():
     args = cmdline.parse()
     config = file.load_default()
+    # Default config is trusted, validate only if it is changed.
+    # Validation is done separately for file and command line changes,
+    # so that the error points to the source.
     if args.config:
         user_config = file.load(args.config)
         config.update(user_config)
-    _validate_schema(config, 'invalid config file parameter')
+        _validate_schema(config, 'invalid config file parameter')
     if args.set:
         for arg in args.set:
             key, value = arg.split('=', 2)
-            try:
-                value = ast.literal_eval(value)
-            except Exception:
-                raise ValueError('invalid value for config key \'%s\'' % (key,))
-            config_path = key.split('.')
+            value = _parse_value(key, value)
+            *config_path, config_key = key.split('.')
             config_node = config
-            for key_element in config_path[:-1]:
-                config_node = config[key_element]
-            config_node[config_path[-1]] = value
+            for key_element in config_path:
+                config_node = config_node[key_element]
+            config_node[config_key] = value
         _validate_schema(config, 'invalid command line config parameter')
     return args, config
 
@@ -66,8 +68,30 @@ def validate(config):
         log.warning('Server mode is enabled, but there are no accepted tokens')
 
 
+def _parse_value(key, value):
+    """Parse config value passed from the command line.
+
+    Most values are valid JSON as well, C-coded JSON parser is tried
+    first. Python literals (single quoted strings, True/False/None,
+    tuples) are handled by literal_eval.
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(value)
+    except Exception:
+        raise ValueError('invalid value for config key \'%s\'' % (key,))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_validator():
+    return jsonschema.Draft4Validator(schemas.CONFIG)
+
+
 def _validate_schema(config, message):
-    validator = jsonschema.Draft4Validator(schemas.CONFIG)
+    validator = _get_validator()
     try:
         error = jsonschema.exceptions.best_match(validator.iter_errors(config))
         if error:
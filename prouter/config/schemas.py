@@ -31,13 +31,14 @@ def nullable(schema):
     }
 
 
-def fixed_object(properties):
+def fixed_object(properties, optional=()):
     assert isinstance(properties, dict)
+    assert set(optional) <= set(properties)
     return {
         'type': 'object',
         'properties': properties,
         'additionalProperties': False,
-        'required': list(properties.keys())
+        'required': [key for key in properties if key not in optional]
     }
 
 
@@ -87,8 +88,26 @@ SERVER = fixed_object(
             'type': 'array',
             'items': TOKEN,
             'description': 'List of valid client tokens.'
+        },
+        'event_loop': {
+            'type': 'string',
+            'enum': ['asyncio', 'uvloop', 'uringcore'],
+            'description': (
+                'Event loop implementation to use, asyncio if not set '
+                '(optional). Falls back to asyncio if the requested '
+                'one is not installed.'
+            )
+        },
+        'eager_tasks': {
+            'type': 'boolean',
+            'description': (
+                'Use eager task factory (Python 3.12+), tasks start '
+                'running on creation. Disabled if not set (optional).'
+            )
         }
-    }
+    },
+    # Added later, configs written before should stay valid.
+    optional=('event_loop', 'eager_tasks')
 )
 
 
@@ -103,8 +122,18 @@ CONTROL = fixed_object(
         'interface': nullable({
             'type': 'string',
             'description': 'Interface (ip address) to listen on.'
+        }),
+        'max_upload_size': nullable({
+            'type': 'integer',
+            'minimum': 0,
+            'description': (
+                'Maximum size (in bytes) of a single file or archive '
+                'upload, no limit if not set (optional).'
+            )
         })
-    }
+    },
+    # Added later, configs written before should stay valid.
+    optional=('max_upload_size',)
 )
 
 CLIENT = fixed_object(
@@ -21,17 +21,43 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import asyncio
 import logging
+import uuid
 
+import pagent.agent_service
 import prpc
 
 from . import identity
 
 
+RPC_JOB_COUNT = (
+    pagent.agent_service.AgentService.job_count_current_connection.__name__
+)
+
+
 class ConnectionNotFound(Exception):
     """Cannot find requested connection instance."""
 
 
+class _ConnectionRecord(object):
+    """Registered connection with peer data extracted from handshake."""
+    __slots__ = ('connection', 'incoming', 'peer_uid', 'token', 'descriptor')
+
+    def __init__(self, connection, handshake):
+        self.connection = connection
+        # Only incoming connections are indexed by peer uid.
+        self.incoming = connection.mode == prpc.ConnectionMode.SERVER
+        self.peer_uid = identity.Identity.get_uid(handshake)
+        self.token = identity.Identity.get_token(handshake)
+        # JSON-serializable connection info, listed by the admin API.
+        self.descriptor = {
+            'uid': connection.id,
+            'mode': connection.mode.name,
+            'peer': handshake
+        }
+
+
 class ConnectionManager(object):
     """Connection registry.
 
@@ -39,17 +65,33 @@ class ConnectionManager(object):
       * Register/unregister each connection
       * List all connections (for debug/UI)
       * Close all connections (on application exit)
+
+    Not thread-safe: all methods must be called from the event loop
+    thread, same as prpc invokes connection callbacks. No locking is
+    needed as registry state never changes across an await.
     """
 
     AGENT_RPC_PATH = '/rpc/v1'
+    # Lower bound of the idle check timeout, for tiny polling delays.
+    IDLE_CHECK_TIMEOUT_MIN = 1
     DEFAULT_LOG_NAME = 'prouter.ConnectionManager'
 
     def __init__(self, debug=False, polling_delay=5, logger=None):
         self._log = logger or logging.getLogger(self.DEFAULT_LOG_NAME)
         self._debug = debug
         self._polling_delay = polling_delay
+        # Connection records by connection id.
         self._connections = {}
+        # Secondary index: incoming connection records by peer uid.
         self._incoming_by_uid = {}
+        # Incremented each time set of connections changes.
+        self._revision = 0
+        # Distinguishes revisions of different manager instances
+        # (e.g. across router restarts).
+        self._instance_token = uuid.uuid4().hex
+        # Outgoing connections closed automatically when idle.
+        self._watched = set()
+        self._watcher_task = None
 
     @property
     def debug(self):
@@ -61,9 +103,21 @@ class ConnectionManager(object):
         """Config parameter controlling poll rate of active connections."""
         return self._polling_delay
 
+    @property
+    def revision(self):
+        """Opaque string changed every time a connection is (un)registered.
+
+        Unique across manager instances, so it is safe to use as an ETag.
+        """
+        return '%s-%d' % (self._instance_token, self._revision)
+
     def get_connections(self):
         """Get all active connections."""
-        return list(self._connections.values())
+        return [record.connection for record in self._connections.values()]
+
+    def get_descriptors(self):
+        """Get JSON-serializable info about all active connections."""
+        return [record.descriptor for record in self._connections.values()]
 
     def connection(self, connection_uid):
         """Get connection by connection uid.
@@ -71,7 +125,7 @@ class ConnectionManager(object):
         Note: connection uid is unrelated to the peer uid.
         """
         try:
-            return self._connections[connection_uid]
+            return self._connections[connection_uid].connection
         except KeyError:
             raise ConnectionNotFound(
                 'connection \'%s\' is not found' % (connection_uid,)
@@ -79,12 +133,12 @@ class ConnectionManager(object):
 
     def by_peer_uid(self, agent_uid):
         """Get connection by peer uid."""
-        connection = self._incoming_by_uid.get(agent_uid)
-        if connection is None:
+        record = self._incoming_by_uid.get(agent_uid)
+        if record is None:
             raise ConnectionNotFound(
                 'no connected agent with uid \'%s\'' % (agent_uid,)
             )
-        return connection
+        return record.connection
 
     def register(self, connection, handshake):
         """Try to register new connection with given handshake."""
@@ -96,41 +150,101 @@ class ConnectionManager(object):
         # However, proper implementation (condition etc)
         # is unfeasibly complicated for now and polling
         # is too ugly.
-        peer_uid = identity.Identity.get_uid(handshake)
+        record = _ConnectionRecord(connection, handshake)
         if connection.id in self._connections:
             raise ValueError(
                 'connection \'%s\' (mode: %s) is already registered' %
                 (connection.id, connection.mode)
             )
-        if connection.mode == prpc.ConnectionMode.SERVER:
-            if peer_uid in self._incoming_by_uid:
+        if record.incoming:
+            if record.peer_uid in self._incoming_by_uid:
                 raise ValueError(
                     'incoming connection from peer \'%s\' '
-                    'is already registered' % (peer_uid,)
+                    'is already registered' % (record.peer_uid,)
                 )
-            self._incoming_by_uid[peer_uid] = connection
+            self._incoming_by_uid[record.peer_uid] = record
         connection.on_close.append(self._unregister)
-        self._connections[connection.id] = connection
+        self._connections[connection.id] = record
+        self._revision += 1
         self._log.info(
             'New connection: id \'%s\', mode: %s, peer: \'%s\', token: \'%s\'',
             connection.id,
             connection.mode.name,
-            peer_uid,
-            identity.Identity.get_token(handshake)
+            record.peer_uid,
+            record.token
         )
 
     def _unregister(self, connection):
         """Unregisters connection when it is closed."""
-        del self._connections[connection.id]
-        peer_uid = identity.Identity.get_uid(connection.handshake_data)
-        if connection.mode == prpc.ConnectionMode.SERVER:
-            del self._incoming_by_uid[peer_uid]
+        # Peer data is cached in the record, no handshake parsing.
+        record = self._connections.pop(connection.id)
+        self._revision += 1
+        if record.incoming:
+            del self._incoming_by_uid[record.peer_uid]
         self._log.info(
             'Dropped connection: '
             'id \'%s\', mode: %s, peer: \'%s\', token: \'%s\'',
             connection.id,
             connection.mode.name,
-            identity.Identity.get_uid(connection.handshake_data),
-            identity.Identity.get_token(connection.handshake_data)
+            record.peer_uid,
+            record.token
         )
-        connection.on_close.remove(self._unregister)
+
+    def watch(self, connection):
+        """Close the connection automatically when it has no running jobs.
+
+        Should be used for outgoing (router->agent) connections only.
+        All watched connections are polled by a single task.
+        """
+        assert connection.mode == prpc.ConnectionMode.CLIENT
+        assert self._polling_delay >= 0
+        self._watched.add(connection)
+        connection.on_close.append(self._unwatch)
+        if self._watcher_task is None or self._watcher_task.done():
+            self._watcher_task = connection.loop.create_task(
+                self._watch_connections()
+            )
+
+    def _unwatch(self, connection):
+        """Stops watching connection when it is closed."""
+        self._watched.discard(connection)
+        if not self._watched and self._watcher_task is not None:
+            self._watcher_task.cancel()
+            self._watcher_task = None
+
+    async def _watch_connections(self):
+        """Poll watched connections, closing idle ones.
+
+        Each check is time limited, so a single hung agent does not
+        stop idle connections of other agents from being closed.
+        """
+        timeout = max(self._polling_delay, self.IDLE_CHECK_TIMEOUT_MIN)
+        while self._watched:
+            await asyncio.sleep(self._polling_delay)
+            connections = list(self._watched)
+            results = await asyncio.gather(
+                *[asyncio.wait_for(self._close_if_idle(connection), timeout)
+                  for connection in connections],
+                return_exceptions=True
+            )
+            for connection, result in zip(connections, results):
+                if isinstance(result, asyncio.TimeoutError):
+                    self._log.warning(
+                        'Idle check of connection \'%s\' timed out',
+                        connection.id
+                    )
+                elif isinstance(result, Exception):
+                    self._log.error(
+                        'Idle check of connection \'%s\' failed: %s',
+                        connection.id, result, exc_info=result
+                    )
+
+    async def _close_if_idle(self, connection):
+        if not connection.connected or connection.active:
+            return
+        job_count = await connection.call_simple(RPC_JOB_COUNT)
+        if not job_count:
+            # Note: closing the last watched connection cancels the
+            # watcher task, so shield protects connection._close
+            # from cancelling itself.
+            await asyncio.shield(connection.close())
@@ -54,29 +54,42 @@ ROUTE_JOB_FILE_API = _ROUTE_PREFIX_JOBS + '/file/{%s:.+}' % (
 ROUTE_JOB_ARCHIVE_API = _ROUTE_PREFIX_JOBS + '/archive'
 
 
-ROUTES = [
-    ('GET', ROUTE_INFO, handlers.admin.info),
-    ('GET', ROUTE_CONNECTIONS, handlers.admin.connections),
-    ('POST', ROUTE_SHUTDOWN, handlers.admin.shutdown),
-    ('POST', ROUTE_JOB_CREATE, handlers.jobs.job_create),
-    ('POST', ROUTE_JOB_REMOVE, handlers.jobs.job_remove),
-    ('POST', ROUTE_JOB_WAIT, handlers.jobs.job_wait),
-    ('GET', ROUTE_JOB_INFO, handlers.jobs.job_info),
-    ('POST', ROUTE_JOB_START, handlers.jobs.job_start),
-    ('*', ROUTE_JOB_HTTP, handlers.proxy.proxy_passive),
-    ('POST', ROUTE_JOB_WS_ACTIVE, handlers.proxy.proxy_active),
-    ('*', ROUTE_JOB_FILE_API, handlers.files.single_file),
-    ('*', ROUTE_JOB_ARCHIVE_API, handlers.files.archive)
-]
-
-
-MIDDLEWARES = [
+# URL dispatcher matches resources in the registration order, so
+# the high-traffic job routes (proxy and file transfer) go first.
+# Route patterns are compiled once on registration, and fixed paths
+# (admin, job create) are matched without regular expressions.
+ROUTES = (
+    aiohttp.web.route('*', ROUTE_JOB_HTTP, handlers.proxy.proxy_passive),
+    aiohttp.web.route('GET', ROUTE_JOB_FILE_API, handlers.files.file_download),
+    aiohttp.web.route('POST', ROUTE_JOB_FILE_API, handlers.files.file_upload),
+    aiohttp.web.route(
+        'GET', ROUTE_JOB_ARCHIVE_API, handlers.files.archive_download
+    ),
+    aiohttp.web.route(
+        'POST', ROUTE_JOB_ARCHIVE_API, handlers.files.archive_upload
+    ),
+    aiohttp.web.route(
+        'POST', ROUTE_JOB_WS_ACTIVE, handlers.proxy.proxy_active
+    ),
+    aiohttp.web.route('GET', ROUTE_JOB_INFO, handlers.jobs.job_info),
+    aiohttp.web.route('POST', ROUTE_JOB_WAIT, handlers.jobs.job_wait),
+    aiohttp.web.route('POST', ROUTE_JOB_START, handlers.jobs.job_start),
+    aiohttp.web.route('POST', ROUTE_JOB_REMOVE, handlers.jobs.job_remove),
+    aiohttp.web.route('POST', ROUTE_JOB_CREATE, handlers.jobs.job_create),
+    aiohttp.web.route('GET', ROUTE_INFO, handlers.admin.info),
+    aiohttp.web.route('GET', ROUTE_CONNECTIONS, handlers.admin.connections),
+    aiohttp.web.route('POST', ROUTE_SHUTDOWN, handlers.admin.shutdown)
+)
+
+
+MIDDLEWARES = (
     handlers.middleware.error_middleware,
     aiohttp.web.normalize_path_middleware(append_slash=False)
-]
+)
 
 
-def get_application(connection_manager, identity, exit_handler, logger):
+def get_application(connection_manager, identity, exit_handler, logger,
+                    max_upload_size=None):
     """Creates the control web application.
 
     Control app exposes 3 main APIs:
@@ -88,10 +101,13 @@ def get_application(connection_manager, identity, exit_handler, logger):
     app[handlers.common.KEY_CONN_MANAGER] = connection_manager
     app[handlers.common.KEY_IDENTITY] = identity
     app[handlers.admin.KEY_EXIT_HANDLER] = exit_handler
+    app[handlers.files.KEY_MAX_UPLOAD_SIZE] = max_upload_size
+    app[handlers.admin.KEY_INFO_BODY] = handlers.admin.info_body(identity)
 
     app.on_response_prepare.append(pagent.handlers.signals.disable_cache)
+    app.on_startup.append(handlers.proxy.open_proxy_session)
+    app.on_cleanup.append(handlers.proxy.close_proxy_session)
 
-    for method, route, handler in ROUTES:
-        app.router.add_route(method, route, handler)
+    app.add_routes(ROUTES)
 
     return app
@@ -22,32 +22,44 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
+import http
+
 import aiohttp.web
 
 from . import common
 
 
 KEY_EXIT_HANDLER = 'exit_handler'
+KEY_INFO_BODY = 'info_body'
+
+
+def info_body(identity):
+    """Serialize router info, it does not change during app lifetime."""
+    return common.json_dumps(identity.get_server_handshake())
 
 
 async def info(request):
     """Return info about router instance."""
-    identity = request.app[common.KEY_IDENTITY]
-    return aiohttp.web.json_response(data=identity.get_server_handshake())
+    return aiohttp.web.Response(
+        body=request.app[KEY_INFO_BODY], content_type='application/json'
+    )
 
 
 async def connections(request):
     """Return info about open connections."""
     conn_manager = request.app[common.KEY_CONN_MANAGER]
-    result = []
-    for connection in conn_manager.get_connections():
-        connection_desc = {
-            'uid': connection.id,
-            'mode': connection.mode.name,
-            'peer': connection.handshake_data
-        }
-        result.append(connection_desc)
-    return aiohttp.web.json_response(data={'connections': result})
+    # Connection descriptors never change, so listing only changes
+    # when connections are (un)registered.
+    etag = 'W/"%s"' % (conn_manager.revision,)
+    if request.headers.get('If-None-Match') == etag:
+        return aiohttp.web.Response(
+            status=http.HTTPStatus.NOT_MODIFIED, headers={'ETag': etag}
+        )
+    response = common.json_response(
+        {'connections': conn_manager.get_descriptors()}
+    )
+    response.headers['ETag'] = etag
+    return response
 
 
 async def shutdown(request):
@@ -21,10 +21,61 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import aiohttp.web
+import jsonschema
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
 
 KEY_CONN_MANAGER = 'conn_mgr'
 KEY_IDENTITY = 'auth'
 
+_SCHEMA_DRAFT4 = 'http://json-schema.org/draft-04/schema#'
+
 
 class InvalidRequestData(Exception):
     """Request data is invalid - wrong url parameters, headers etc."""
+
+
+def json_response(data):
+    """Make JSON response, faster replacement of aiohttp json_response."""
+    return aiohttp.web.Response(
+        body=json_dumps(data), content_type='application/json'
+    )
+
+
+def schema_validator(schema):
+    """Make a function validating request payloads against the schema.
+
+    Schema is checked immediately. Validation is compiled to Python code
+    if fastjsonschema is installed. Invalid payloads always raise
+    jsonschema.ValidationError.
+    """
+    jsonschema.Draft4Validator.check_schema(schema)
+    if fastjsonschema is None:
+        return jsonschema.Draft4Validator(schema).validate
+
+    validate = fastjsonschema.compile(
+        dict(schema, **{'$schema': _SCHEMA_DRAFT4})
+    )
+
+    def validate_compiled(instance):
+        try:
+            validate(instance)
+        except fastjsonschema.JsonSchemaException as ex:
+            raise jsonschema.ValidationError(ex.message)
+
+    return validate_compiled
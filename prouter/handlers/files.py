@@ -21,6 +21,8 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import asyncio
+
 import aiohttp.web
 
 import pagent.agent_service
@@ -38,105 +40,122 @@ QUERY_KEY_COMPRESS = 'compress'
 
 CONTENT_TYPE_BINARY = 'application/octet-stream'
 
+KEY_MAX_UPLOAD_SIZE = 'max_upload_size'
 
-async def single_file(request):
-    """Handle file upload/download requests.
+# Flag query parameter words (case-insensitive), besides integers.
+_QUERY_FLAG_TRUE = frozenset(('true', 'yes'))
+_QUERY_FLAG_FALSE = frozenset(('false', 'no'))
 
-    GET is download, POST is upload.
-    """
+# Agent RPC method names.
+RPC_FILE_DOWNLOAD = pagent.agent_service.AgentService.file_download.__name__
+RPC_FILE_UPLOAD = pagent.agent_service.AgentService.file_upload.__name__
+RPC_ARCHIVE_DOWNLOAD = (
+    pagent.agent_service.AgentService.archive_download.__name__
+)
+RPC_ARCHIVE_UPLOAD = pagent.agent_service.AgentService.archive_upload.__name__
+
+UPLOAD_CHUNK_SIZE = 1 << 17
+# Smaller received chunks are merged before sending to the agent.
+UPLOAD_COALESCE_SIZE = 1 << 16
+PIPELINE_QUEUE_DEPTH = 4
+
+
+async def file_download(request):
+    """Handle file download requests."""
     conn_manager = request.app[common.KEY_CONN_MANAGER]
     conn_uid = request.match_info[jobs.ROUTE_VARIABLE_CONNECTION_UID]
     job_uid = request.match_info[jobs.ROUTE_VARIABLE_JOB_UID]
     fspath = request.match_info[ROUTE_VARIABLE_FSPATH]
     connection = conn_manager.connection(conn_uid)
-    if request.method == 'GET':
-        # Optional query param: remove=0/1
-        remove_source = bool(
-            int(request.query.getone(QUERY_KEY_REMOVE_FILE, 0))
-        )
-        rpc_call = connection.call_istream(
-            pagent.agent_service.AgentService.file_download.__name__,
+    # Optional query param: remove=0/1
+    remove_source = _query_flag(request, QUERY_KEY_REMOVE_FILE)
+    rpc_call = connection.call_istream(
+        RPC_FILE_DOWNLOAD,
+        [job_uid, fspath],
+        {
+            'remove': remove_source
+        }
+    )
+    return await _send_file(request, rpc_call)
+
+
+async def file_upload(request):
+    """Handle file upload requests."""
+    conn_manager = request.app[common.KEY_CONN_MANAGER]
+    conn_uid = request.match_info[jobs.ROUTE_VARIABLE_CONNECTION_UID]
+    job_uid = request.match_info[jobs.ROUTE_VARIABLE_JOB_UID]
+    fspath = request.match_info[ROUTE_VARIABLE_FSPATH]
+    connection = conn_manager.connection(conn_uid)
+    # Optional query param: executable=0/1
+    executable_flag = _query_flag(request, QUERY_KEY_EXECUTABLE)
+    if request.content_type == CONTENT_TYPE_BINARY:
+        if request.content_length is None:
+            raise common.InvalidRequestData('no Content-Length provided')
+        _check_upload_size(request)
+
+        rpc_call = connection.call_ostream(
+            RPC_FILE_UPLOAD,
             [job_uid, fspath],
             {
-                'remove': remove_source
+                'executable': executable_flag
             }
         )
-        return await _send_file(request, rpc_call)
-    elif request.method == 'POST':
-        # Optional query param: executable=0/1
-        executable_flag = bool(
-            int(request.query.getone(QUERY_KEY_EXECUTABLE, 0))
+        await _accept_file(request, rpc_call)
+    # TODO: Support form data.
+    else:
+        raise common.InvalidRequestData(
+            'unsupported content type for HTTP upload'
         )
-        if request.content_type == CONTENT_TYPE_BINARY:
-            if request.content_length is None:
-                raise common.InvalidRequestData('no Content-Length provided')
-
-            rpc_call = connection.call_ostream(
-                pagent.agent_service.AgentService.file_upload.__name__,
-                [job_uid, fspath],
-                {
-                    'executable': executable_flag
-                }
-            )
-            await _accept_file(request, rpc_call)
-        # TODO: Support form data.
-        else:
-            raise common.InvalidRequestData(
-                'unsupported content type for HTTP upload'
-            )
 
-        return aiohttp.web.Response()
-    else:
-        raise common.InvalidRequestData('unsupported HTTP method')
+    return aiohttp.web.Response()
+
 
+async def archive_download(request):
+    """Handle batch (.tar archive) download requests."""
+    conn_manager = request.app[common.KEY_CONN_MANAGER]
+    conn_uid = request.match_info[jobs.ROUTE_VARIABLE_CONNECTION_UID]
+    job_uid = request.match_info[jobs.ROUTE_VARIABLE_JOB_UID]
+    connection = conn_manager.connection(conn_uid)
+    # Optional query param: include=<mask>
+    include_mask = request.query.getone(QUERY_KEY_INCLUDE, None)
+    # Optional query param: exclude=<mask>
+    exclude_mask = request.query.getone(QUERY_KEY_EXCLUDE, None)
+    # Optional query param: compress=0/1
+    compress = _query_flag(request, QUERY_KEY_COMPRESS)
+    rpc_call = connection.call_istream(
+        RPC_ARCHIVE_DOWNLOAD,
+        [job_uid],
+        {
+            'include_mask': include_mask,
+            'exclude_mask': exclude_mask,
+            'compress': compress
+        }
+    )
+    return await _send_file(request, rpc_call)
 
-async def archive(request):
-    """Handle batch (.tar archive) upload/download requests.
 
-    GET is download, POST is upload.
-    """
+async def archive_upload(request):
+    """Handle batch (.tar archive) upload requests."""
     conn_manager = request.app[common.KEY_CONN_MANAGER]
     conn_uid = request.match_info[jobs.ROUTE_VARIABLE_CONNECTION_UID]
     job_uid = request.match_info[jobs.ROUTE_VARIABLE_JOB_UID]
     connection = conn_manager.connection(conn_uid)
-    if request.method == 'GET':
-        # Optional query param: include=<mask>
-        include_mask = request.query.getone(QUERY_KEY_INCLUDE, None)
-        # Optional query param: exclude=<mask>
-        exclude_mask = request.query.getone(QUERY_KEY_EXCLUDE, None)
-        # Optional query param: compress=0/1
-        compress = bool(
-            int(request.query.getone(QUERY_KEY_COMPRESS, False))
+    if request.content_type == CONTENT_TYPE_BINARY:
+        # Content-Length is optional - archives may be streamed
+        # by the client while being built (chunked encoding).
+        _check_upload_size(request)
+        rpc_call = connection.call_ostream(
+            RPC_ARCHIVE_UPLOAD,
+            [job_uid]
         )
-        rpc_call = connection.call_istream(
-            pagent.agent_service.AgentService.archive_download.__name__,
-            [job_uid],
-            {
-                'include_mask': include_mask,
-                'exclude_mask': exclude_mask,
-                'compress': compress
-            }
+        await _accept_file(request, rpc_call)
+    # TODO: Support form data.
+    else:
+        raise common.InvalidRequestData(
+            'unsupported content type for HTTP upload'
         )
-        return await _send_file(request, rpc_call)
-    elif request.method == 'POST':
-        if request.content_type == CONTENT_TYPE_BINARY:
-            if request.content_length is None:
-                raise common.InvalidRequestData('no Content-Length provided')
-
-            rpc_call = connection.call_ostream(
-                pagent.agent_service.AgentService.archive_upload.__name__,
-                [job_uid]
-            )
-            await _accept_file(request, rpc_call)
-        # TODO: Support form data.
-        else:
-            raise common.InvalidRequestData(
-                'unsupported content type for HTTP upload'
-            )
 
-        return aiohttp.web.Response()
-    else:
-        raise common.InvalidRequestData('unsupported HTTP method')
+    return aiohttp.web.Response()
 
 
 async def _send_file(request, rpc_call):
@@ -151,9 +170,8 @@ async def _send_file(request, rpc_call):
             response.content_type = CONTENT_TYPE_BINARY
             response.content_length = header['size']
             await response.prepare(request)
-            async for chunk in rpc_call.stream:
-                await response.write(chunk)
-                await response.drain()
+            # Awaited write applies backpressure itself.
+            await _pipeline(request.app.loop, rpc_call.stream, response.write)
         # Failed immediately.
         # TODO: Specialized error handling, esp. file does not exist?
         else:
@@ -161,19 +179,112 @@ async def _send_file(request, rpc_call):
     return response
 
 
+def _query_flag(request, key):
+    """Get boolean flag passed as an optional query parameter.
+
+    Unknown values are rejected rather than guessed, some flags
+    (e.g. remove) are destructive.
+    """
+    value = request.query.get(key)
+    if value is None or value.lower() in _QUERY_FLAG_FALSE:
+        return False
+    if value.lower() in _QUERY_FLAG_TRUE:
+        return True
+    try:
+        return bool(int(value))
+    except ValueError:
+        raise common.InvalidRequestData(
+            'invalid value of query parameter \'%s\': %s' % (key, value)
+        )
+
+
+def _check_upload_size(request):
+    """Reject too large upload before it is forwarded to the agent."""
+    max_size = request.app.get(KEY_MAX_UPLOAD_SIZE)
+    if (max_size is not None and request.content_length is not None and
+            request.content_length > max_size):
+        raise common.InvalidRequestData(
+            'upload size exceeds the limit of %d bytes' % (max_size,)
+        )
+
+
 async def _accept_file(request, rpc_call):
     received_size = 0
-    async with rpc_call:
-        chunk = await request.content.readany()
-        while chunk:
+    # Declared size is already checked against the upload size limit,
+    # so a single limit is enough. Streamed uploads (no Content-Length)
+    # are limited while received.
+    size_limit = request.content_length
+    if size_limit is not None:
+        limit_error = (
+            'request payload size does not match passed Content-Length'
+        )
+    else:
+        size_limit = request.app.get(KEY_MAX_UPLOAD_SIZE)
+        limit_error = 'upload size exceeds the limit of %s bytes' % (
+            size_limit,
+        )
+
+    async def receive():
+        nonlocal received_size
+        buffer = bytearray()
+        # Larger chunks mean fewer RPC messages and loop wakeups.
+        async for chunk in request.content.iter_chunked(UPLOAD_CHUNK_SIZE):
             received_size += len(chunk)
-            if received_size > request.content_length:
-                raise common.InvalidRequestData(
-                    'request payload size does not '
-                    'match passed Content-Length'
-                )
-            await rpc_call.stream.send(chunk)
-            chunk = await request.content.readany()
+            if size_limit is not None and received_size > size_limit:
+                raise common.InvalidRequestData(limit_error)
+            # Slow clients may deliver data in tiny pieces, send them
+            # in batches. Large chunks are passed without copying.
+            if not buffer and len(chunk) >= UPLOAD_COALESCE_SIZE:
+                yield chunk
+                continue
+            buffer += chunk
+            if len(buffer) >= UPLOAD_COALESCE_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    async with rpc_call:
+        await _pipeline(request.app.loop, receive(), rpc_call.stream.send)
         accepted_size = await rpc_call.result
         if accepted_size != received_size:
             raise ValueError('upload failed')
+
+
+async def _pipeline(loop, source, send):
+    """Pass chunks from async iterable to the send coroutine function.
+
+    Sending is done in a separate task, so the next chunk is received
+    while the previous one is being sent. Bounded queue between them
+    limits the amount of buffered data.
+    """
+    queue = asyncio.Queue(PIPELINE_QUEUE_DEPTH)
+    send_failed = False
+
+    async def sender():
+        nonlocal send_failed
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    return
+                await send(chunk)
+        except Exception:
+            # Keep draining, so that receiving side is never blocked.
+            send_failed = True
+            while await queue.get() is not None:
+                pass
+            raise
+
+    send_task = loop.create_task(sender())
+    try:
+        async for chunk in source:
+            if send_failed:
+                break
+            await queue.put(chunk)
+    except BaseException:
+        send_task.cancel()
+        await asyncio.wait([send_task])
+        raise
+    await queue.put(None)
+    await send_task
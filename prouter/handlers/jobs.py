@@ -21,11 +21,8 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import asyncio
 import random
 
-import aiohttp.web
-import jsonschema
 import yarl
 
 import pagent.agent_service
@@ -39,6 +36,18 @@ ROUTE_VARIABLE_CONNECTION_UID = 'conn_uid'
 ROUTE_VARIABLE_JOB_UID = 'job_uid'
 
 
+# Agent RPC method names.
+RPC_JOB_CREATE = pagent.agent_service.AgentService.job_create.__name__
+RPC_JOB_REMOVE = pagent.agent_service.AgentService.job_remove.__name__
+RPC_JOB_WAIT = pagent.agent_service.AgentService.job_wait.__name__
+RPC_JOB_INFO = pagent.agent_service.AgentService.job_info.__name__
+RPC_JOB_START = pagent.agent_service.AgentService.job_start.__name__
+
+# Agent handshake keys.
+_KEY_PLATFORM = pagent.identity.KEY_PLATFORM
+_KEY_PROPERTIES = pagent.identity.KEY_PROPERTIES
+
+
 SCHEMA_JOB_CREATE = {
     'type': 'object',
     'properties': {
@@ -115,48 +124,22 @@ SCHEMA_JOB_START = {
 }
 
 
+# Validators are built once, schemas are checked on import.
+_validate_job_create = common.schema_validator(SCHEMA_JOB_CREATE)
+_validate_job_start = common.schema_validator(SCHEMA_JOB_START)
+
+
 def _extend_job_info(connection, info):
     """Extends job info with connection/API related data."""
-    info['path'] = '/jobs/%s/%s' % (connection.id, info['uid'])
+    handshake = connection.handshake_data
+    info['path'] = f'/jobs/{connection.id}/{info["uid"]}'
     info['agent'] = {
-        'platform': connection.handshake_data[pagent.identity.KEY_PLATFORM],
-        'properties': connection.handshake_data[pagent.identity.KEY_PROPERTIES]
+        'platform': handshake[_KEY_PLATFORM],
+        'properties': handshake[_KEY_PROPERTIES]
     }
     return info
 
 
-def _watch_active_connection(connection, polling_delay):
-    """Create a watcher for the connection, automatically closing it
-    if it has no running jobs.
-
-    Should be used for outgoing (router->agent) connections only.
-    """
-    assert polling_delay >= 0
-    async def connection_watcher():
-        while connection.connected:
-            if not connection.active:
-                method = (
-                    pagent.agent_service.
-                    AgentService.job_count_current_connection
-                )
-                job_count = await connection.call_simple(method.__name__)
-                if not job_count:
-                    # Note: connection_unwatch is called directly from here,
-                    # so shield protects connection._close
-                    # from cancelling itself.
-                    await asyncio.shield(connection.close())
-                    return
-            await asyncio.sleep(polling_delay)
-
-    watcher_task = connection.loop.create_task(connection_watcher())
-
-    async def connection_unwatch(connection):
-        watcher_task.cancel()
-        await asyncio.wait([watcher_task])
-
-    connection.on_close.append(connection_unwatch)
-
-
 async def job_create(request):
     """Create a new job on a given agent.
 
@@ -165,8 +148,8 @@ async def job_create(request):
     """
     identity = request.app[common.KEY_IDENTITY]
     conn_manager = request.app[common.KEY_CONN_MANAGER]
-    request_data = await request.json()
-    jsonschema.validate(request_data, SCHEMA_JOB_CREATE)
+    request_data = await request.json(loads=common.json_loads)
+    _validate_job_create(request_data)
     job_name = request_data['name']
     agent_locator = request_data['agent']
     agent_locator_type = agent_locator['type']
@@ -180,10 +163,9 @@ async def job_create(request):
     elif agent_locator_type == 'address':
         agent_address = agent_locator['address']
         agent_token = agent_locator['token']
-        url = yarl.URL.build(
-            scheme='http',
-            host=agent_address,
-            path=conn_manager.AGENT_RPC_PATH
+        # Address may contain port, so it is not passed as a host.
+        url = yarl.URL(
+            'http://%s%s' % (agent_address, conn_manager.AGENT_RPC_PATH)
         )
 
         async def on_connected(connection, handshake):
@@ -204,7 +186,7 @@ async def job_create(request):
 
     try:
         info = await connection.call_simple(
-            pagent.agent_service.AgentService.job_create.__name__, job_name
+            RPC_JOB_CREATE, job_name
         )
     except:
         if connection.mode == prpc.ConnectionMode.CLIENT:
@@ -212,9 +194,9 @@ async def job_create(request):
         raise
 
     if connection.mode == prpc.ConnectionMode.CLIENT:
-        _watch_active_connection(connection, conn_manager.polling_delay)
+        conn_manager.watch(connection)
 
-    return aiohttp.web.json_response(_extend_job_info(connection, info))
+    return common.json_response(_extend_job_info(connection, info))
 
 
 async def job_remove(request):
@@ -224,9 +206,9 @@ async def job_remove(request):
     job_uid = request.match_info[ROUTE_VARIABLE_JOB_UID]
     connection = conn_manager.connection(conn_uid)
     info = await connection.call_simple(
-        pagent.agent_service.AgentService.job_remove.__name__, job_uid
+        RPC_JOB_REMOVE, job_uid
     )
-    return aiohttp.web.json_response(_extend_job_info(connection, info))
+    return common.json_response(_extend_job_info(connection, info))
 
 
 async def job_wait(request):
@@ -236,9 +218,9 @@ async def job_wait(request):
     job_uid = request.match_info[ROUTE_VARIABLE_JOB_UID]
     connection = conn_manager.connection(conn_uid)
     info = await connection.call_simple(
-        pagent.agent_service.AgentService.job_wait.__name__, job_uid
+        RPC_JOB_WAIT, job_uid
     )
-    return aiohttp.web.json_response(_extend_job_info(connection, info))
+    return common.json_response(_extend_job_info(connection, info))
 
 
 async def job_info(request):
@@ -248,9 +230,9 @@ async def job_info(request):
     job_uid = request.match_info[ROUTE_VARIABLE_JOB_UID]
     connection = conn_manager.connection(conn_uid)
     info = await connection.call_simple(
-        pagent.agent_service.AgentService.job_info.__name__, job_uid
+        RPC_JOB_INFO, job_uid
     )
-    return aiohttp.web.json_response(_extend_job_info(connection, info))
+    return common.json_response(_extend_job_info(connection, info))
 
 
 async def job_start(request):
@@ -258,11 +240,11 @@ async def job_start(request):
     conn_manager = request.app[common.KEY_CONN_MANAGER]
     conn_uid = request.match_info[ROUTE_VARIABLE_CONNECTION_UID]
     job_uid = request.match_info[ROUTE_VARIABLE_JOB_UID]
-    request_data = await request.json()
-    jsonschema.validate(request_data, SCHEMA_JOB_START)
+    request_data = await request.json(loads=common.json_loads)
+    _validate_job_start(request_data)
     connection = conn_manager.connection(conn_uid)
     info = await connection.call_simple(
-        pagent.agent_service.AgentService.job_start.__name__,
+        RPC_JOB_START,
         job_uid,
         request_data['args'],
         request_data['env'],
@@ -270,4 +252,4 @@ async def job_start(request):
         request_data.get('port_expected_count', 1),
         request_data.get('forward_stdout', False)
     )
-    return aiohttp.web.json_response(_extend_job_info(connection, info))
+    return common.json_response(_extend_job_info(connection, info))
@@ -22,14 +22,10 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import asyncio
-import enum
 import http
-import io
 
 import aiohttp
 import aiohttp.web
-import jsonschema
-import multidict
 
 import pagent.agent_service
 import prpc
@@ -38,10 +34,20 @@ from . import common, jobs
 
 
 PROXY_EXCEPTION_TIMEOUT = 5
-WS_PROXY_EVENT_QUEUE_DEPTH = 32
+PROXY_MALFORMED_RESPONSE_BODY = b'Malformed response from agent.'
 
 ROUTE_VARIABLE_PATH = 'path'
 
+KEY_PROXY_SESSION = 'proxy_session'
+
+# Cache-related response headers (lowercase), dropped from proxied
+# responses as dynamic proxy content shouldn't be cached.
+PROXY_DROPPED_HEADERS = frozenset(('cache-control', 'expires'))
+
+# Agent RPC method names.
+RPC_WS_CONNECT = pagent.agent_service.AgentService.ws_connect.__name__
+RPC_HTTP_REQUEST = pagent.agent_service.AgentService.http_request.__name__
+
 
 SCHEMA_PROXY_ACTIVE = {
     'type': 'object',
@@ -52,12 +58,24 @@ SCHEMA_PROXY_ACTIVE = {
     'additionalProperties': False
 }
 
+_validate_proxy_active = common.schema_validator(SCHEMA_PROXY_ACTIVE)
 
-@enum.unique
-class WSMessageDirection(enum.Enum):
-    """Websocket message direction for event queue."""
-    JOB_TO_CLIENT = enum.auto()
-    CLIENT_TO_JOB = enum.auto()
+
+async def open_proxy_session(app):
+    """Application startup hook creating client session for WS bridges.
+
+    Each bridge holds its connection while open, so the pool is not
+    limited. Cookies are not shared between unrelated bridges.
+    """
+    app[KEY_PROXY_SESSION] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0),
+        cookie_jar=aiohttp.DummyCookieJar()
+    )
+
+
+async def close_proxy_session(app):
+    """Application cleanup hook closing client session for WS bridges."""
+    await app[KEY_PROXY_SESSION].close()
 
 
 async def proxy_passive(request):
@@ -91,13 +109,14 @@ async def proxy_active(request):
 
     # NOTE: We can support additional WS connection features like
     # subprotocols or heartbeat. They should go into this config.
-    payload = await request.json()
-    jsonschema.validate(payload, SCHEMA_PROXY_ACTIVE)
+    payload = await request.json(loads=common.json_loads)
+    _validate_proxy_active(payload)
 
     connection = request.app[common.KEY_CONN_MANAGER].connection(conn_uid)
     remote_ws_established = request.app.loop.create_future()
     request.app.loop.create_task(
         _proxy_active(
+            request.app[KEY_PROXY_SESSION],
             payload['url'],
             connection,
             job_uid,
@@ -118,13 +137,13 @@ async def proxy_active(request):
         )
 
 
-async def _proxy_active(url, connection, job_uid, path, query, headers,
-                        remote_ws_established):
+async def _proxy_active(session, url, connection, job_uid, path, query,
+                        headers, remote_ws_established):
     """Establishes an agent-side WS connection, reports back to the caller,
     try to establish a WS tunnel to a given url.
     """
     call = connection.call_bistream(
-        pagent.agent_service.AgentService.ws_connect.__name__,
+        RPC_WS_CONNECT,
         [job_uid, path, query, headers]
     )
 
@@ -141,11 +160,11 @@ async def _proxy_active(url, connection, job_uid, path, query, headers,
                 return
             else:
                 remote_ws_established.set_result(True)
-            async with aiohttp.ClientSession() as session:
-                async with session.ws_connect(url) as websocket:
-                    return await _proxy_websocket_events(
-                        call, websocket, connection.loop
-                    )
+            # Session is shared by all bridges of the application.
+            async with session.ws_connect(url) as websocket:
+                return await _proxy_websocket_events(
+                    call, websocket, connection.loop
+                )
     except Exception as ex:
         if not remote_ws_established.done():
             remote_ws_established.set_exception(ex)
@@ -161,7 +180,7 @@ async def _proxy_http(request, connection, job_uid, path):
         path: HTTP path.
     """
     call = connection.call_bistream(
-        pagent.agent_service.AgentService.http_request.__name__,
+        RPC_HTTP_REQUEST,
         [
             job_uid, request.method, path,
             list(request.query.items()),
@@ -173,13 +192,15 @@ async def _proxy_http(request, connection, job_uid, path):
             _proxy_http_forward_response(request, call)
         )
         try:
-            while True:
-                chunk = await request.content.readany()
+            async for chunk in request.content.iter_any():
+                # Agent may respond without reading the whole body.
                 if call.stream.is_closed:
                     break
                 await call.stream.send(chunk)
-                if not chunk:
-                    break
+            else:
+                # Empty chunk marks the end of request body.
+                if not call.stream.is_closed:
+                    await call.stream.send(b'')
             response = await response_writer
             return response
         finally:
@@ -207,12 +228,11 @@ async def _proxy_http_forward_response(request, call):
         if msg_index == 0:
             response.set_status(msg)
         elif msg_index == 1:
-            headers = multidict.MultiDict(msg)
             # Drop cache-related headers from the response, if any.
-            # Dynamic proxy content shouldn't be cached.
-            headers.popall('Cache-Control', None)
-            headers.popall('Expires', None)
-            response.headers.update(headers)
+            headers = response.headers
+            for key, value in msg:
+                if key.lower() not in PROXY_DROPPED_HEADERS:
+                    headers.add(key, value)
             # TODO: add proxy headers?
             # (X-Forwarded-For, drop Host => to X-Forwarded-Host,
             #  X-Forwarded-Proto OR the new shiny 'Forwarded')
@@ -270,7 +290,7 @@ async def _proxy_websocket(request, websocket, connection, job_uid, path):
         path: HTTP path.
     """
     call = connection.call_bistream(
-        pagent.agent_service.AgentService.ws_connect.__name__,
+        RPC_WS_CONNECT,
         [
             job_uid, path,
             list(request.query.items()),
@@ -293,45 +313,26 @@ async def _proxy_websocket_events(call, websocket, loop):
         websocket: Client or server websocket object from aiohttp.
         loop: asyncio event loop.
     """
-    # Use event queue to merge to event streams
-    # (messages from/to client).
-    #
-    # Queue is significantly faster than
-    #     asyncio.wait(
-    #         [event_source_1, event_source_2], return_when=FIRST_COMPLETED
-    #     )
-    # as it does not create new Tasks and async context switches.
-    #
-    # Websockets connections are likely to carry a lot of small messages,
-    # so this optmization is pretty important (~3x speedup).
-    event_queue = asyncio.Queue(WS_PROXY_EVENT_QUEUE_DEPTH)
-    ws_listen_task = loop.create_task(
-        _proxy_websocket_listen_ws(websocket, event_queue)
-    )
-    stream_listen_task = loop.create_task(
-        _proxy_websocket_listen_stream(call.stream, event_queue)
-    )
+    # Each direction is forwarded by its own task straight to the
+    # opposite endpoint. Websockets connections are likely to carry
+    # a lot of small messages, so there is no per-message overhead
+    # besides the send itself.
+    forwarders = [
+        loop.create_task(
+            _proxy_websocket_forward_ws(websocket, call.stream)
+        ),
+        loop.create_task(
+            _proxy_websocket_forward_stream(call.stream, websocket)
+        )
+    ]
     try:
-        while True:
-            direction, data = await event_queue.get()
-            if data is None:
-                break
-            if direction == WSMessageDirection.CLIENT_TO_JOB:
-                await call.stream.send(data)
-            elif direction == WSMessageDirection.JOB_TO_CLIENT:
-                if isinstance(data, str):
-                    await websocket.send_str(data)
-                elif isinstance(data, bytes):
-                    await websocket.send_bytes(data)
-                else:
-                    break
-    except Exception:
-        # Any errors just close both sockets.
-        pass
+        await asyncio.wait(forwarders, return_when=asyncio.FIRST_COMPLETED)
     finally:
+        # Any side finished or failed - close both sockets.
         await websocket.close()
         await call.stream.close()
-    await asyncio.wait([ws_listen_task, stream_listen_task], loop=loop)
+    # Errors just close both sockets, ignore them.
+    await asyncio.gather(*forwarders, return_exceptions=True)
     try:
         await call.result
     except prpc.RpcError:
@@ -340,30 +341,29 @@ async def _proxy_websocket_events(call, websocket, loop):
     return websocket
 
 
-async def _proxy_websocket_listen_ws(websocket, event_queue):
-    """Forward messages from websocket (from client) to event queue.
+async def _proxy_websocket_forward_ws(websocket, stream):
+    """Forward messages from websocket (from client) to pRpc stream.
 
-    Each message is stored as tuple (CLIENT_TO_JOB, payload).
-    When websocket is closed for any reason, one last message with 'None'
-    payload is emitted.
+    Returns when websocket is closed or non-data message is received.
     """
     async for msg in websocket:
         if msg.type not in (aiohttp.WSMsgType.BINARY, aiohttp.WSMsgType.TEXT):
             break
-        await event_queue.put((WSMessageDirection.CLIENT_TO_JOB, msg.data))
-    await event_queue.put((WSMessageDirection.CLIENT_TO_JOB, None))
+        await stream.send(msg.data)
 
 
-async def _proxy_websocket_listen_stream(stream, event_queue):
-    """Forward messages from websocket (from agent job) to event queue.
+async def _proxy_websocket_forward_stream(stream, websocket):
+    """Forward messages from pRpc stream (from agent job) to websocket.
 
-    Each message is stored as tuple (JOB_TO_CLIENT, payload).
-    When websocket is closed for any reason, one last message with 'None'
-    payload is emitted.
+    Returns when stream is closed or unexpected message is received.
     """
     async for msg in stream:
-        await event_queue.put((WSMessageDirection.JOB_TO_CLIENT, msg))
-    await event_queue.put((WSMessageDirection.JOB_TO_CLIENT, None))
+        if isinstance(msg, str):
+            await websocket.send_str(msg)
+        elif isinstance(msg, bytes):
+            await websocket.send_bytes(msg)
+        else:
+            break
 
 
 async def _proxy_error_response(call):
@@ -378,21 +378,17 @@ async def _proxy_error_response(call):
             await call.cancel()
         return aiohttp.web.Response(
             status=http.HTTPStatus.BAD_GATEWAY,
-            text='Malformed response from agent.'
+            body=PROXY_MALFORMED_RESPONSE_BODY,
+            content_type='text/plain'
         )
     except prpc.RpcError as ex:
-        buffer = io.StringIO()
-        buffer.write('Proxy error:\n')
-        buffer.write('-' * 40)
-        buffer.write('\nError type: ')
-        buffer.write(type(ex).__name__)
-        buffer.write('\n\nError message: ')
-        buffer.write(ex.cause_message)
-        # TODO: Output only in 'debug mode'?
-        buffer.write('\n\n')
-        buffer.write(ex.remote_traceback)
-        buffer.write('\n')
+        # TODO: Output traceback only in 'debug mode'?
+        text = (
+            f'Proxy error:\n{"-" * 40}\n'
+            f'Error type: {type(ex).__name__}\n\n'
+            f'Error message: {ex.cause_message}\n\n'
+            f'{ex.remote_traceback}\n'
+        )
         return aiohttp.web.Response(
-            status=http.HTTPStatus.BAD_GATEWAY,
-            text=buffer.getvalue()
+            status=http.HTTPStatus.BAD_GATEWAY, text=text
         )
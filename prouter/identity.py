@@ -23,7 +23,7 @@
 
 import logging
 import platform
-import uuid
+import secrets
 
 
 KEY_AUTH = 'auth'
@@ -32,6 +32,10 @@ KEY_NAME = 'name'
 KEY_TOKEN = 'token'
 KEY_PLATFORM = 'platform'
 
+# Platform info does not change, it is shared by all handshakes
+# and must not be modified.
+_PLATFORM = dict(platform.uname()._asdict())
+
 
 class AuthError(Exception):
     """Raised when peer credentials are rejected."""
@@ -62,10 +66,10 @@ class Identity(object):
         self._log = logger or logging.getLogger(self.DEFAULT_LOGGER_NAME)
         if uid is None:
             self._log.info('Router uid is not set, generating a new one')
-            uid = uuid.uuid4().hex
+            uid = secrets.token_hex(16)
         self._uid = uid
         self._name = name
-        self._server_tokens = set(server_tokens)
+        self._server_tokens = frozenset(server_tokens)
 
         for server_token in self._server_tokens:
             self._check_token(server_token)
@@ -93,7 +97,7 @@ class Identity(object):
                 KEY_UID: self._uid,
                 KEY_NAME: self._name,
             },
-            KEY_PLATFORM: dict(platform.uname()._asdict())
+            KEY_PLATFORM: _PLATFORM
         }
 
     def validate_incoming_handshake(self, handshake):
@@ -108,8 +112,12 @@ class Identity(object):
         if not isinstance(auth_data.get(KEY_NAME), str):
             raise TypeError('peer name is invalid')
         peer_token = auth_data.get(KEY_TOKEN)
-        self._check_token(peer_token)
-        if not peer_token in self._server_tokens:
+        # Server tokens are checked on init, so known token is valid.
+        # Type check goes first as unhashable values can't be looked up.
+        if (not isinstance(peer_token, (str, bytes)) or
+                peer_token not in self._server_tokens):
+            # Report malformed token as such.
+            self._check_token(peer_token)
             raise AuthError('peer token is not authorized')
 
     def _check_token(self, token):
@@ -30,9 +30,9 @@ from . import handlers
 ROUTE_RPC_SERVER = '/rpc/v1'
 
 
-ROUTES = [
-    ('GET', ROUTE_RPC_SERVER, handlers.rpc.accept_agent)
-]
+ROUTES = (
+    aiohttp.web.route('GET', ROUTE_RPC_SERVER, handlers.rpc.accept_agent),
+)
 
 
 def get_application(connection_manager, identity, logger):
@@ -41,6 +41,5 @@ def get_application(connection_manager, identity, logger):
     app = aiohttp.web.Application(logger=logger)
     app[handlers.common.KEY_CONN_MANAGER] = connection_manager
     app[handlers.common.KEY_IDENTITY] = identity
-    for method, route, handler in ROUTES:
-        app.router.add_route(method, route, handler)
+    app.add_routes(ROUTES)
     return app
@@ -27,6 +27,11 @@ import sys
 
 import pytest
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from pagent.test.conftest import http_server_command
 
 from . import helper_router_process
@@ -58,14 +63,40 @@ def router_process(event_loop):
     return factory
 
 
-@pytest.fixture
+@pytest.fixture(scope='module')
+def router(event_loop):
+    """Router process shared by all tests of a module.
+
+    Tests must remove the jobs they create.
+    """
+    router = helper_router_process.RouterProcess(loop=event_loop)
+    event_loop.run_until_complete(router.__aenter__())
+    yield router
+    event_loop.run_until_complete(router.__aexit__(None, None, None))
+
+
+@pytest.fixture(scope='module')
 def event_loop():
-    """Get the eventloop instance for async tests."""
+    """Get the eventloop instance for async tests.
+
+    Module scoped, so module fixtures may keep async resources.
+    """
     if sys.platform == 'win32':
         asyncio.set_event_loop(asyncio.ProactorEventLoop())
+    elif uvloop is not None:
+        asyncio.set_event_loop(uvloop.new_event_loop())
     else:
         asyncio.set_event_loop(asyncio.SelectorEventLoop())
-    return asyncio.get_event_loop()
+    loop = asyncio.get_event_loop()
+    # Python 3.12+: tasks start running immediately, without waiting
+    # for the next loop iteration.
+    eager_task_factory = getattr(asyncio, 'eager_task_factory', None)
+    if eager_task_factory is not None:
+        loop.set_task_factory(eager_task_factory)
+    yield loop
+    # Module fixtures using the loop are finalized by now.
+    asyncio.set_event_loop(None)
+    loop.close()
 
 
 @pytest.fixture(scope='function')
@@ -91,9 +122,8 @@ def pytest_pyfunc_call(pyfuncitem):
         event_loop = pyfuncitem.funcargs[EVENTLOOP_FIXTURE]
 
         funcargs = pyfuncitem.funcargs
-        testargs = {
-          arg: funcargs[arg] for arg in pyfuncitem._fixtureinfo.argnames
-        }
+        # Argnames follow the test function signature order.
+        testargs = [funcargs[arg] for arg in pyfuncitem._fixtureinfo.argnames]
 
-        event_loop.run_until_complete(pyfuncitem.obj(**testargs))
+        event_loop.run_until_complete(pyfuncitem.obj(*testargs))
         return True
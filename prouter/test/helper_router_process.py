@@ -23,6 +23,7 @@
 
 import asyncio
 import http
+import json
 import logging
 import pathlib
 import sys
@@ -38,6 +39,8 @@ from prouter import control_app, router_app
 
 
 LOCALHOST_WS_URL = yarl.URL("ws://127.0.0.1")
+# Router process working directory (repository root).
+ROUTER_WORKDIR = pathlib.Path(__file__).absolute().parents[2]
 
 
 class RouterProcess(object):
@@ -47,15 +50,16 @@ class RouterProcess(object):
         self._client_enabled = client_enabled
         self._accepted_token = uuid.uuid4().hex
         self._agent_uid = uuid.uuid4().hex
-        process_args = [sys.executable, '-m', 'prouter']
-        process_args.extend([
-            '--connection-debug'
-        ])
-        process_args.extend([
-            '--set',
-            'server.accept_tokens=["%s"]' % (self._accepted_token,)
-        ])
-        process_args.extend(args)
+        # Router parses `--set` values as JSON, falling back to Python
+        # literals; strings quoted by json.dumps are valid for both.
+        process_args = [
+            sys.executable, '-m', 'prouter',
+            '--connection-debug',
+            '--set', 'server.accept_tokens=%s' % (
+                json.dumps([self._accepted_token]),
+            ),
+            *args
+        ]
         self._process = polled_process.PolledProcess(
             process_args,
             None,
@@ -64,6 +68,7 @@ class RouterProcess(object):
         self._session = None
         self._port_control = None
         self._port_router = None
+        self._endpoint_control = None
         self._agent_process = None
 
     @property
@@ -72,7 +77,7 @@ class RouterProcess(object):
 
     @property
     def endpoint_control(self):
-        return LOCALHOST_WS_URL.with_port(self._port_control)
+        return self._endpoint_control
 
     @property
     def endpoint_router(self):
@@ -112,16 +117,16 @@ class RouterProcess(object):
                 'address': address,
                 'token': self._agent_process.accepted_token
             }
-        response = await self._session.request(
+        async with self._session.request(
             'POST',
             self.endpoint_control.with_path(control_app.ROUTE_JOB_CREATE),
             json={
                 'name': 'test job',
                 'agent': agent_id
             }
-        )
-        assert response.status == http.HTTPStatus.OK
-        return await response.json()
+        ) as response:
+            assert response.status == http.HTTPStatus.OK
+            return await response.json()
 
     async def job_remove(self, job_path):
         async with self._session.request(
@@ -163,14 +168,26 @@ class RouterProcess(object):
             return await response.json()
 
     async def job_http(self, job_path, method, path, **kwargs):
-        response = await self._session.request(
+        # Body is read before the connection is released back to the
+        # pool, so `text()`/`json()` still work on the returned response.
+        async with self._session.request(
             method,
             self.endpoint_control.with_path(job_path + '/http' + path),
             **kwargs
-        )
-        return response
+        ) as response:
+            await response.read()
+            return response
+
+    async def job_http_many(self, job_path, requests):
+        """Run several (method, path) job requests concurrently."""
+        return await asyncio.gather(*[
+            self.job_http(job_path, method, path)
+            for method, path in requests
+        ])
 
     async def job_ws(self, job_path, path, **kwargs):
+        # Test messages are tiny, permessage-deflate is pure overhead.
+        kwargs.setdefault('compress', 0)
         response = await self._session.ws_connect(
             self.endpoint_control.with_path(job_path + '/http' + path),
             **kwargs
@@ -188,41 +205,60 @@ class RouterProcess(object):
 
     async def __aenter__(self):
         CONNECT_TIMEOUT = 10
-        CONNECT_POLL_DELAY = 0.1
+        CONNECT_POLL_DELAY_MIN = 0.01
+        CONNECT_POLL_DELAY_MAX = 0.1
         AGENT_RECONNECT_DELAY = 1
         self._log.info('Starting router process')
         await self._process.start(
-            workdir=pathlib.Path(__file__).absolute().parents[2],
+            workdir=ROUTER_WORKDIR,
             port_expected_count=2
         )
-        self._session = aiohttp.ClientSession(loop=self._loop)
+        # Keep-alive connections are reused by the polling requests below
+        # and by the job helpers.
+        connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=30)
+        self._session = aiohttp.ClientSession(connector=connector)
         try:
             assert len(self._process.ports) == 2
             self._log.info('Startup successfull, detecting control port')
             ports = list(self._process.ports)
-            for port in self._process.ports:
-                response = await self._session.get(
-                    LOCALHOST_WS_URL.with_port(port).with_path(
-                        control_app.ROUTE_INFO
-                    )
-                )
-                if response.status != http.HTTPStatus.NOT_FOUND:
+            info_url = LOCALHOST_WS_URL.with_path(control_app.ROUTE_INFO)
+
+            async def is_control_port(port):
+                async with self._session.get(
+                    info_url.with_port(port)
+                ) as response:
+                    return response.status != http.HTTPStatus.NOT_FOUND
+
+            # Probe all ports at once.
+            probes = await asyncio.gather(
+                *[is_control_port(port) for port in ports]
+            )
+            # Exactly two ports, router port is the other one.
+            for port, is_control in zip(ports, probes):
+                if is_control:
                     self._port_control = port
-                    break
+                else:
+                    self._port_router = port
             assert self._port_control is not None
-            ports.remove(self._port_control)
-            self._port_router, = ports
+            assert self._port_router is not None
+            self._endpoint_control = LOCALHOST_WS_URL.with_port(
+                self._port_control
+            )
             self._log.info('Control port: %d', self._port_control)
             self._log.info('Router port:  %d', self._port_router)
 
             # Start the agent.
             self._agent_process = helper_agent_process.AgentProcess(
-                '--set', 'identity.uid="%s"' % (self._agent_uid,),
+                '--set', 'identity.uid=%s' % (json.dumps(self._agent_uid),),
+                # pAgent may parse values as Python literals only, pass
+                # True/False; double-quoted strings suit both parsers.
                 '--set', 'client.enabled=%s' % (self._client_enabled,),
-                '--set', 'client.address="127.0.0.1:%d"' % (
-                    self._port_router,
+                '--set', 'client.address=%s' % (
+                    json.dumps('127.0.0.1:%d' % (self._port_router,)),
+                ),
+                '--set', 'client.token=%s' % (
+                    json.dumps(self._accepted_token),
                 ),
-                '--set', 'client.token="%s"' % (self._accepted_token,),
                 '--set', 'client.reconnect_delay=%d' % (AGENT_RECONNECT_DELAY,),
                 # We don't need direct RPC connection to the agent.
                 connect=False,
@@ -232,23 +268,38 @@ class RouterProcess(object):
             if self._client_enabled:
                 # Wait until agent connects to router.
                 connected = False
+                # Agent usually connects fast, poll with backoff.
+                poll_delay = CONNECT_POLL_DELAY_MIN
+                etag = ''
                 agent_connect_start = self._loop.time()
                 while self._loop.time() - agent_connect_start < CONNECT_TIMEOUT:
-                    response = await self._session.get(
+                    # Listing is downloaded only if it has changed.
+                    async with self._session.get(
                         self.endpoint_control.with_path(
                             control_app.ROUTE_CONNECTIONS
-                        )
-                    )
-                    connections = await response.json()
-                    target_connections = [
-                        conn for conn in connections['connections']
-                        if conn['peer']['auth']['uid'] == self._agent_uid
-                    ]
-                    if len(target_connections) == 1:
+                        ),
+                        headers={'If-None-Match': etag}
+                    ) as response:
+                        if response.status == http.HTTPStatus.OK:
+                            etag = response.headers.get('ETag', '')
+                            connections = await response.json()
+                            # Router keeps a single incoming connection
+                            # per uid.
+                            agent_connected = any(
+                                conn['peer']['auth']['uid'] ==
+                                self._agent_uid
+                                for conn in connections['connections']
+                            )
+                        else:
+                            assert (response.status ==
+                                    http.HTTPStatus.NOT_MODIFIED)
+                            agent_connected = False
+                    if agent_connected:
                         connected = True
                         self._log.info('Agent successfully connected to router')
                         break
-                    await asyncio.sleep(CONNECT_POLL_DELAY, loop=self._loop)
+                    await asyncio.sleep(poll_delay)
+                    poll_delay = min(poll_delay * 2, CONNECT_POLL_DELAY_MAX)
                 if not connected:
                     raise RuntimeError(
                         'agent failed to connect to router in time'
@@ -268,18 +319,18 @@ class RouterProcess(object):
         # Shutdown the router.
         if self._process.state == polled_process.ProcessState.RUNNING:
             self._log.debug('Sending shutdown command using control API')
-            await self._session.post(
+            async with self._session.post(
                 self.endpoint_control.with_path(control_app.ROUTE_SHUTDOWN)
-            )
+            ):
+                pass
             try:
-                await asyncio.wait_for(
-                    self._process.wait(), KILL_DELAY, loop=self._loop
-                )
+                await asyncio.wait_for(self._process.wait(), KILL_DELAY)
                 self._log.debug('Router finalized successfully')
             except asyncio.TimeoutError:
                 await self._process.kill()
         self._agent_process = None
         self._port_control = None
         self._port_router = None
+        self._endpoint_control = None
         await self._session.close()
         return False
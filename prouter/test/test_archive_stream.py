@@ -0,0 +1,136 @@
+#
+# coding: utf-8
+# Copyright (c) 2018 DATADVANCE
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import io
+import os
+import pathlib
+import sys
+import tarfile
+
+import pytest
+
+from prouter import archive_stream
+
+
+def _archive(*members):
+    """Build tar archive from (TarInfo, content) pairs."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as arc:
+        for info, content in members:
+            if content is not None:
+                info.size = len(content)
+                content = io.BytesIO(content)
+            arc.addfile(info, content)
+    buffer.seek(0)
+    return tarfile.open(fileobj=buffer, mode='r|')
+
+
+def _file(name, content):
+    return tarfile.TarInfo(name), content
+
+
+def _link(name, target, link_type=tarfile.SYMTYPE):
+    info = tarfile.TarInfo(name)
+    info.type = link_type
+    info.linkname = target
+    return info, None
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX links')
+def test_links_kept(tmpdir):
+    """Absolute and relative symlinks and hard links inside the
+    destination are extracted as is.
+    """
+    path = pathlib.Path(tmpdir)
+    arc = _archive(
+        _file('job/data.txt', b'data'),
+        _link('job/py', '/usr/bin/python3'),
+        _link('job/data_link.txt', 'data.txt'),
+        _link('job/data_hard.txt', 'job/data.txt', tarfile.LNKTYPE)
+    )
+    with arc:
+        archive_stream.safe_extractall(arc, path)
+    assert os.readlink(str(path.joinpath('job/py'))) == '/usr/bin/python3'
+    assert path.joinpath('job/data_link.txt').read_bytes() == b'data'
+    assert path.joinpath('job/data_hard.txt').read_bytes() == b'data'
+    assert path.joinpath('job/data_hard.txt').samefile(
+        path.joinpath('job/data.txt')
+    )
+
+
+@pytest.mark.parametrize('members', [
+    # Member name outside of the destination.
+    [_file('../outside.txt', b'data')],
+    [_file('/outside.txt', b'data')],
+    # Writing through a link pointing outside of the destination.
+    [_link('job/out', '/'), _file('job/out/outside.txt', b'data')],
+    # Hard link to a file outside of the destination.
+    [_link('job/passwd', '../../etc/passwd', tarfile.LNKTYPE)]
+])
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX links')
+def test_outside_rejected(tmpdir, members):
+    """Nothing is written outside of the destination directory."""
+    path = pathlib.Path(tmpdir.mkdir('destination'))
+    arc = _archive(*members)
+    with arc, pytest.raises(ValueError):
+        archive_stream.safe_extractall(arc, path)
+    assert not pathlib.Path(tmpdir).joinpath('outside.txt').exists()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX links')
+def test_rename_hard_link(tmpdir):
+    """Hard link targets are renamed along with the members."""
+    path = pathlib.Path(tmpdir)
+
+    def rename(name):
+        prefix = 'tgt/x/'
+        return name[len(prefix):] if name.startswith(prefix) else None
+
+    arc = _archive(
+        _file('tgt/x/data.txt', b'data'),
+        _link('tgt/x/hard.txt', 'tgt/x/data.txt', tarfile.LNKTYPE),
+        _file('tgt/other.txt', b'other'),
+        _link('tgt/x/other_hard.txt', 'tgt/other.txt', tarfile.LNKTYPE)
+    )
+    with arc, pytest.raises(ValueError):
+        archive_stream.safe_extractall(arc, path, rename)
+    assert path.joinpath('hard.txt').samefile(path.joinpath('data.txt'))
+    assert not path.joinpath('other.txt').exists()
+
+
+def test_pack_directory_file(tmpdir):
+    """Spooled archive holds the directory items under the target."""
+    source = pathlib.Path(tmpdir.mkdir('source'))
+    source.joinpath('data.txt').write_bytes(b'data')
+    source.joinpath('sub').mkdir()
+    source.joinpath('sub', 'nested.txt').write_bytes(b'nested')
+    buffer = io.BytesIO()
+    archive_stream.pack_directory_file(
+        source, pathlib.PurePosixPath('tgt'), buffer
+    )
+    buffer.seek(0)
+    with tarfile.open(fileobj=buffer) as arc:
+        assert sorted(arc.getnames()) == [
+            'tgt/data.txt', 'tgt/sub', 'tgt/sub/nested.txt'
+        ]
+        assert arc.extractfile('tgt/sub/nested.txt').read() == b'nested'
@@ -22,9 +22,13 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import asyncio
+import os
+import pathlib
 
 import pytest
 
+from prouter.client import RouterClient
+
 
 @pytest.mark.async_test
 async def test_http_job(event_loop, router_process, http_server_command):
@@ -68,4 +72,47 @@ async def test_connection_timeout(event_loop, router_process,
                 break
             if event_loop.time() - start > CONNECTION_TIMEOUT_MAX_WAIT:
                 raise RuntimeError('connection is not dropped for too long')
-            await asyncio.sleep(CONNECTION_CHECK_DELAY, loop=event_loop)
+            await asyncio.sleep(CONNECTION_CHECK_DELAY)
+
+
+@pytest.mark.async_test
+async def test_download_directory_hard_link(event_loop, router, tmpdir):
+    """Download a job subdirectory containing a hard link."""
+    source = pathlib.Path(tmpdir.mkdir('source'))
+    source.joinpath('x').mkdir()
+    source.joinpath('x', 'data.txt').write_bytes(b'data')
+    os.link(
+        str(source.joinpath('x', 'data.txt')),
+        str(source.joinpath('x', 'hard.txt'))
+    )
+    destination = pathlib.Path(tmpdir.join('destination'))
+
+    client = RouterClient(
+        '127.0.0.1:%d' % (router.endpoint_control.port,),
+        session=router.session
+    )
+    job = await client.create_job('test job', router.agent_uid)
+    async with job:
+        await job.upload('tgt', str(source))
+        # Archive members are renamed ('tgt/x/' is stripped), hard link
+        # targets must be renamed too.
+        await job.download_directory('tgt/x', str(destination))
+    assert sorted(os.listdir(destination)) == ['data.txt', 'hard.txt']
+    assert destination.joinpath('data.txt').read_bytes() == b'data'
+    assert destination.joinpath('hard.txt').read_bytes() == b'data'
+
+
+@pytest.mark.async_test
+async def test_upload_directory_spooled(event_loop, router, tmpdir):
+    """Upload a directory as a spooled archive with Content-Length."""
+    source = pathlib.Path(tmpdir.mkdir('source'))
+    source.joinpath('data.txt').write_bytes(b'data')
+
+    client = RouterClient(
+        '127.0.0.1:%d' % (router.endpoint_control.port,),
+        session=router.session
+    )
+    job = await client.create_job('test job', router.agent_uid)
+    async with job:
+        await job.upload('tgt', str(source), spool=True)
+        assert await job.download_file('tgt/data.txt') == b'data'
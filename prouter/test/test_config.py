@@ -0,0 +1,52 @@
+#
+# coding: utf-8
+# Copyright (c) 2018 DATADVANCE
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import pytest
+
+
+# Config file as written for routers without the later optional keys.
+LEGACY_CONFIG = '''
+identity:
+  name: "legacy router"
+  uid: null
+server:
+  enabled: True
+  port: 0
+  interface: "127.0.0.1"
+  accept_tokens: []
+control:
+  interface: "127.0.0.1"
+  port: 0
+client:
+  polling_delay: 5
+'''
+
+
+@pytest.mark.async_test
+async def test_legacy_config(event_loop, router_process, tmpdir):
+    """Check that config files lacking optional keys are still accepted."""
+    config_path = tmpdir.join('legacy.yaml')
+    config_path.write(LEGACY_CONFIG)
+    async with router_process('--config', str(config_path)) as router:
+        job = await router.job_create()
+        await router.job_remove(job['path'])
@@ -37,36 +37,46 @@ import prpc
 
 
 @pytest.mark.async_test
-async def test_http_proxy(event_loop, router_process, http_server_command):
+async def test_http_proxy(event_loop, router, http_server_command):
     """Basic sanity test for HTTP proxy - check HTTP content/status forwarding,
     check websocket connection.
     """
-    async with router_process() as router:
-        job = await router.job_create()
+    TEST_MESSAGE = b'it\'s alive!'
+
+    async def ws_echo(job_path):
+        websocket = await router.job_ws(job_path, '/ws_echo')
+        await websocket.send_bytes(TEST_MESSAGE)
+        echo = await websocket.receive_bytes()
+        await websocket.close()
+        return echo
+
+    job = await router.job_create()
+    try:
         await router.job_start(job['path'], http_server_command())
 
-        response = await router.job_http(job['path'], 'GET', '/')
+        # HTTP and websocket checks are independent, run them together.
+        (response, missing), echo = await asyncio.gather(
+            router.job_http_many(
+                job['path'], [('GET', '/'), ('GET', '/no_such_path')]
+            ),
+            ws_echo(job['path'])
+        )
         assert 'TestHeader' in response.headers
         assert response.headers['TestHeader'] == 'hello world!'
         assert response.status == http.HTTPStatus.OK
         payload = await response.text()
         assert payload == 'hello world!'
-
-        response = await router.job_http(job['path'], 'GET', '/no_such_path')
-        assert response.status == http.HTTPStatus.NOT_FOUND
-
-        TEST_MESSAGE = b'it\'s alive!'
-        websocket = await router.job_ws(job['path'], '/ws_echo')
-        await websocket.send_bytes(TEST_MESSAGE)
-        assert await websocket.receive_bytes() == TEST_MESSAGE
-        await websocket.close()
+        assert missing.status == http.HTTPStatus.NOT_FOUND
+        assert echo == TEST_MESSAGE
 
         await router.job_http(job['path'], 'GET', '/shutdown')
         await router.job_wait(job['path'])
+    finally:
+        await router.job_remove(job['path'])
 
 
 @pytest.mark.async_test
-async def test_active_ws(event_loop, router_process, http_server_command):
+async def test_active_ws(event_loop, router, http_server_command):
     """Test active ws connection API - ask router to actively establish
     a tunnel between the client and the job.
     """
@@ -78,7 +88,7 @@ async def test_active_ws(event_loop, router_process, http_server_command):
     echo_received = event_loop.create_future()
 
     async def ws_handler(request):
-        response = aiohttp.web.WebSocketResponse()
+        response = aiohttp.web.WebSocketResponse(compress=False)
         await response.prepare(request)
         connected.set_result(True)
         await response.send_bytes(TEST_MESSAGE)
@@ -96,8 +106,14 @@ async def test_active_ws(event_loop, router_process, http_server_command):
 
     async with server as endpoints:
         (test_address, test_port), = endpoints
-        async with router_process() as router:
-            job = await router.job_create()
+        test_url = str(yarl.URL.build(
+            scheme='http',
+            host=test_address,
+            port=test_port,
+            path=TEST_WS_PATH
+        ))
+        job = await router.job_create()
+        try:
             await router.job_start(job['path'], http_server_command())
 
             response = await router.session.request(
@@ -105,32 +121,27 @@ async def test_active_ws(event_loop, router_process, http_server_command):
                 router.endpoint_control.with_path(
                     job['path'] + '/wsconnect' + '/ws_echo'
                 ),
-                json={
-                    'url': yarl.URL.build(
-                        scheme='http',
-                        host=test_address,
-                        port=test_port,
-                        path=TEST_WS_PATH
-                    ).__str__()
-                }
+                json={'url': test_url}
             )
             assert response.status == http.HTTPStatus.OK
 
-            await asyncio.wait_for(connected, WS_TIMEOUT, loop=event_loop)
-            await asyncio.wait_for(echo_received, WS_TIMEOUT, loop=event_loop)
+            await asyncio.wait_for(connected, WS_TIMEOUT)
+            await asyncio.wait_for(echo_received, WS_TIMEOUT)
 
             await router.job_http(job['path'], 'GET', '/shutdown')
             await router.job_wait(job['path'])
+        finally:
+            await router.job_remove(job['path'])
 
 
 @pytest.mark.async_test
-async def test_upload_download(event_loop, router_process):
+async def test_upload_download(event_loop, router):
     """Check basic file upload/download features."""
     TEST_DATA_PAYLOAD = uuid.uuid4().bytes * (1 << 20)
     UPLOAD_FILENAME = 'the_data.bin'
 
-    async with router_process() as router:
-        job = await router.job_create()
+    job = await router.job_create()
+    try:
         response = await router.session.request(
             'POST',
             router.endpoint_control.with_path(
@@ -140,7 +151,7 @@ async def test_upload_download(event_loop, router_process):
                 'Content-Type': 'application/octet-stream',
                 'Content-Length': str(len(TEST_DATA_PAYLOAD))
             },
-            data=io.BytesIO(TEST_DATA_PAYLOAD)
+            data=TEST_DATA_PAYLOAD
         )
         async with response:
             assert response.status == http.HTTPStatus.OK
@@ -152,87 +163,188 @@ async def test_upload_download(event_loop, router_process):
         )
         async with response:
             assert response.status == http.HTTPStatus.OK
-            buffer = io.BytesIO()
-            chunk = await response.content.readany()
-            while chunk:
-                buffer.write(chunk)
-                chunk = await response.content.readany()
-            data = buffer.getvalue()
+            # Router sends file size, read the whole body at once.
+            assert response.content_length == len(TEST_DATA_PAYLOAD)
+            data = await response.content.readexactly(response.content_length)
             assert data == TEST_DATA_PAYLOAD
+    finally:
         await router.job_remove(job['path'])
 
 
 @pytest.mark.async_test
-async def test_upload_download_archive(event_loop, router_process, tmpdir):
-    """Check archive upload/download features.
+async def test_query_flags(event_loop, router):
+    """Check that unknown flag values are rejected, not taken as true."""
+    TEST_DATA_PAYLOAD = b'flag test'
+    job = await router.job_create()
+    try:
+        file_url = router.endpoint_control.with_path(
+            job['path'] + '/file/flags.txt'
+        )
+        response = await router.session.request(
+            'POST',
+            file_url,
+            headers={
+                'Content-Type': 'application/octet-stream',
+                'Content-Length': str(len(TEST_DATA_PAYLOAD))
+            },
+            data=TEST_DATA_PAYLOAD
+        )
+        async with response:
+            assert response.status == http.HTTPStatus.OK
 
-    More checks (unicode etc) are in corresponding test in pAgent.
-    """
-    DATA_PATH = pathlib.Path(tmpdir.mkdir('data'))
-    UPLOAD_PATH = pathlib.Path(tmpdir.join('upload.tar'))
-    DOWNLOAD_ARC = pathlib.Path(tmpdir.join('download.tar'))
-    DOWNLOAD_PATH = pathlib.Path(tmpdir.join('download'))
-    FILES = [
-        'something.py',
-        'whatever.txt',
-        'nested/something_too.py'
-    ]
-    for filename in FILES:
-        target = DATA_PATH.joinpath(filename)
-        target.parent.mkdir(parents=True, exist_ok=True)
-        with open(target, 'w') as target_file:
-            target_file.write(uuid.uuid4().hex * 128)
-    with tarfile.open(UPLOAD_PATH, 'w') as arc:
-        for file_path in DATA_PATH.iterdir():
-            arc.add(file_path, arcname=file_path.name)
-    async with router_process() as router:
+        for value in ['off', 'maybe', '']:
+            response = await router.session.request(
+                'GET', file_url.with_query({'remove': value})
+            )
+            async with response:
+                assert response.status == http.HTTPStatus.BAD_REQUEST
+                assert 'remove' in await response.text()
+
+        # Integers and case-insensitive words are accepted, file is
+        # not removed.
+        for value in ['00', '0', 'false', 'FALSE', 'No']:
+            response = await router.session.request(
+                'GET', file_url.with_query({'remove': value})
+            )
+            async with response:
+                assert response.status == http.HTTPStatus.OK
+                assert await response.read() == TEST_DATA_PAYLOAD
+    finally:
+        await router.job_remove(job['path'])
+
+
+@pytest.mark.async_test
+async def test_upload_size_limit(event_loop, router_process):
+    """Check that uploads over `control.max_upload_size` are rejected."""
+    MAX_UPLOAD_SIZE = 1024
+
+    async def stream_payload():
+        # Streamed upload, size is not known in advance.
+        for _ in range(4):
+            yield bytes(MAX_UPLOAD_SIZE)
+
+    async with router_process(
+        '--set', 'control.max_upload_size=%d' % (MAX_UPLOAD_SIZE,)
+    ) as router:
         job = await router.job_create()
-        with open(UPLOAD_PATH, 'rb') as arc:
+        try:
+            # Declared Content-Length over the limit.
             response = await router.session.request(
                 'POST',
                 router.endpoint_control.with_path(
-                    job['path'] + '/archive'
+                    job['path'] + '/file/too_large.bin'
                 ),
                 headers={
                     'Content-Type': 'application/octet-stream',
-                    'Content-Length': str(UPLOAD_PATH.stat().st_size)
+                    'Content-Length': str(MAX_UPLOAD_SIZE + 1)
                 },
-                data=arc
+                data=bytes(MAX_UPLOAD_SIZE + 1)
             )
             async with response:
-                assert response.status == http.HTTPStatus.OK
-        with open(DOWNLOAD_ARC, 'wb') as arc:
+                assert response.status == http.HTTPStatus.BAD_REQUEST
+                assert 'exceeds the limit' in await response.text()
+
+            # Archive exceeding the limit in the middle of the body.
             response = await router.session.request(
-                'GET',
+                'POST',
+                router.endpoint_control.with_path(job['path'] + '/archive'),
+                headers={'Content-Type': 'application/octet-stream'},
+                data=stream_payload()
+            )
+            async with response:
+                assert response.status == http.HTTPStatus.BAD_REQUEST
+                assert 'exceeds the limit' in await response.text()
+
+            # Uploads within the limit still work.
+            response = await router.session.request(
+                'POST',
                 router.endpoint_control.with_path(
-                    job['path'] + '/archive'
-                ).with_query(
-                    {
-                        'include': '*.py',
-                        'exclude': 'nested/*',
-                        'compress': '0'
-                    }
-                )
+                    job['path'] + '/file/small.bin'
+                ),
+                headers={
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Length': str(MAX_UPLOAD_SIZE)
+                },
+                data=bytes(MAX_UPLOAD_SIZE)
             )
             async with response:
                 assert response.status == http.HTTPStatus.OK
-                chunk = await response.content.readany()
-                while chunk:
-                    arc.write(chunk)
-                    chunk = await response.content.readany()
-        with tarfile.open(DOWNLOAD_ARC, 'r') as arc:
-            arc.extractall(DOWNLOAD_PATH)
+        finally:
+            await router.job_remove(job['path'])
+
+
+@pytest.mark.async_test
+async def test_upload_download_archive(event_loop, router, tmpdir):
+    """Check archive upload/download features.
+
+    More checks (unicode etc) are in corresponding test in pAgent.
+    """
+    DOWNLOAD_PATH = pathlib.Path(tmpdir.mkdir('download'))
+    FILES = {
+        filename: (uuid.uuid4().hex * 128).encode()
+        for filename in [
+            'something.py',
+            'whatever.txt',
+            'nested/something_too.py'
+        ]
+    }
+    # Upload archive is built in memory, no files on disk are needed.
+    upload_buffer = io.BytesIO()
+    with tarfile.open(fileobj=upload_buffer, mode='w') as arc:
+        for filename, content in FILES.items():
+            info = tarfile.TarInfo(filename)
+            info.size = len(content)
+            arc.addfile(info, io.BytesIO(content))
+    upload_data = upload_buffer.getvalue()
+    job = await router.job_create()
+    try:
+        response = await router.session.request(
+            'POST',
+            router.endpoint_control.with_path(
+                job['path'] + '/archive'
+            ),
+            headers={
+                'Content-Type': 'application/octet-stream',
+                'Content-Length': str(len(upload_data))
+            },
+            data=upload_data
+        )
+        async with response:
+            assert response.status == http.HTTPStatus.OK
+        response = await router.session.request(
+            'GET',
+            router.endpoint_control.with_path(
+                job['path'] + '/archive'
+            ).with_query(
+                {
+                    'include': '*.py',
+                    'exclude': 'nested/*',
+                    'compress': '0'
+                }
+            )
+        )
+        async with response:
+            assert response.status == http.HTTPStatus.OK
+            archive_data = await response.read()
+
+        def extract():
+            with tarfile.open(fileobj=io.BytesIO(archive_data)) as arc:
+                arc.extractall(DOWNLOAD_PATH)
+
+        # Plain tarfile keeps the check independent of the client code.
+        await event_loop.run_in_executor(None, extract)
         assert len(os.listdir(DOWNLOAD_PATH)) == 1
-        with open(DATA_PATH.joinpath('something.py')) as uploaded:
-            with open(DOWNLOAD_PATH.joinpath('something.py')) as downloaded:
-                assert uploaded.read() == downloaded.read()
+        with open(DOWNLOAD_PATH.joinpath('something.py'), 'rb') as downloaded:
+            assert downloaded.read() == FILES['something.py']
+    finally:
+        await router.job_remove(job['path'])
 
 
 @pytest.mark.async_test
-async def test_job_not_found(event_loop, router_process):
+async def test_job_not_found(event_loop, router):
     """Check HTTP responses if job or connection do not exist."""
-    async with router_process() as router:
-        job = await router.job_create()
+    job = await router.job_create()
+    try:
         await router.job_info(job['path'])
         # Check wrong connection id.
         response = await router.session.request(
@@ -242,10 +354,10 @@ async def test_job_not_found(event_loop, router_process):
             )
         )
         async with response:
+            assert response.status == http.HTTPStatus.NOT_FOUND
             message = await response.text()
             assert 'connection' in message
             assert 'not found' in message
-            assert response.status == http.HTTPStatus.NOT_FOUND
 
         # Check wrong job id.
         response = await router.session.request(
@@ -255,33 +367,33 @@ async def test_job_not_found(event_loop, router_process):
             )
         )
         async with response:
+            assert response.status == http.HTTPStatus.NOT_FOUND
             message = await response.text()
             assert 'job' in message
             assert 'not found' in message
-            assert response.status == http.HTTPStatus.NOT_FOUND
+    finally:
         await router.job_remove(job['path'])
 
 
 @pytest.mark.async_test
-async def test_invalid_request(event_loop, router_process):
+async def test_invalid_request(event_loop, router):
     """Check HTTP response on invalid job_create request payload."""
-    async with router_process() as router:
-        # Don't try to exhaustively test all commands, just check the
-        # general response for jsonschema errors (they should lead to
-        # status 400 instead of 500).
-        response = await router.session.request(
-            'POST',
-            router.endpoint_control.with_path(
-                '/jobs/create'
-            ),
-            json={
-                'name': 'invalid job',
-                'agent': {
-                    'wrong key here': 'and some whatever data'
-                }
+    # Don't try to exhaustively test all commands, just check the
+    # general response for jsonschema errors (they should lead to
+    # status 400 instead of 500).
+    response = await router.session.request(
+        'POST',
+        router.endpoint_control.with_path(
+            '/jobs/create'
+        ),
+        json={
+            'name': 'invalid job',
+            'agent': {
+                'wrong key here': 'and some whatever data'
             }
-        )
-        async with response:
-            message = await response.text()
-            assert 'Invalid request' in message
-            assert response.status == http.HTTPStatus.BAD_REQUEST
+        }
+    )
+    async with response:
+        assert response.status == http.HTTPStatus.BAD_REQUEST
+        message = await response.text()
+        assert 'Invalid request' in message
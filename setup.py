@@ -53,16 +53,26 @@ setuptools.setup(
         'Framework :: AsyncIO',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.6'
+        'Programming Language :: Python :: 3.6',
         'Topic :: Internet :: Proxy Servers',
         'Topic :: Software Development',
     ],
 
     # Dependencies required to make package function properly.
     packages=setuptools.find_packages(exclude=['test']),
+    python_requires='>=3.6',
     install_requires=[
         'pRpc>=1.1.0',
         'pAgent>=0.6.0',
         'aiohttp>=3.1'
-    ]
+    ],
+    # Optional event loop implementations, see `server.event_loop`,
+    # faster JSON serialization and compiled validation of request
+    # payloads.
+    extras_require={
+        'uvloop': ['uvloop'],
+        'uringcore': ['uringcore'],
+        'orjson': ['orjson'],
+        'fastjsonschema': ['fastjsonschema']
+    }
 )